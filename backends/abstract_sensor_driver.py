@@ -1,13 +1,25 @@
+import numpy as np
+
+
 
 class SensorDriver:
 
     SENSOR_SHAPE = (0, 0)  # 传感器形状。对使用SplitDataDict的，给出full_data形状
     DATA_TYPE = '>i2'  # 基础数据格式
     SCALE = 1.  # 某些情况有用
+    VALUE_DTYPE = np.float32  # 处理流程（滤波、标定、插值）中浮点数值的dtype。DataHandler按config中的"value_dtype"覆盖
 
     def __init__(self):
         pass
 
+    @property
+    def stats(self):
+        """
+        采集统计，调用其snapshot()读取。不支持时为None
+        :return: backends.acquisition_stats.AcquisitionStats或None
+        """
+        return None
+
     def connect(self, port) -> bool:
         """
         尝试连接硬件
@@ -37,3 +49,37 @@ class SensorDriver:
         :return: np.ndarray或backends.tactile_split.SplitDataDict
         """
         raise NotImplementedError()
+
+    def get_frame(self):
+        """
+        从缓存提取最早的帧，并移除它。不复制数据，使用完毕后须调用其release
+        :return: backends.decoding.PooledFrame或None
+        """
+        raise NotImplementedError()
+
+    def get_last_frame(self):
+        """
+        从缓存提取最新的帧，并清空缓存。不复制数据，使用完毕后须调用其release
+        :return: backends.decoding.PooledFrame或None
+        """
+        raise NotImplementedError()
+
+    def get_batch(self, max_count=None):
+        """
+        从缓存提取所有的帧（至多max_count帧），并移除它们。各帧堆叠为一个数组，便于向量化处理
+        :return: ((T, *SENSOR_SHAPE)的np.ndarray, 各帧的时间戳组成的list)。缓存为空时为(None, None)
+                 时间戳与get返回的相同，通常为backends.decoding.FrameTime
+        """
+        frames = []
+        while max_count is None or frames.__len__() < max_count:
+            frame = self.get_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        if not frames:
+            return None, None
+        data = np.stack([frame.data for frame in frames])
+        t = [frame.t for frame in frames]
+        for frame in frames:
+            frame.release()
+        return data, t
@@ -0,0 +1,88 @@
+# 采集过程的统计。由解码器及各后端累加，界面或无界面工具可随时读取
+
+import threading
+import time
+
+RATE_WINDOW = 1.  # 统计速率的时间窗(s)
+
+COUNTERS = (
+    'bytes_read',  # 读到的字节数
+    'packages_accepted',  # 写入帧的包数
+    'packages_rejected',  # 包头正确，但未通过CRC或包号校验的包数
+    'crc_failures',  # 其中未通过CRC校验的包数
+    'header_resyncs',  # 失步后跳过字节、重新寻找包头的次数
+    'bytes_skipped',  # 失步时跳过的字节数
+    'frame_number_gaps',  # 新一帧的帧号与上一帧不连续的次数
+    'frames_decoded',  # 解出的完整帧数
+    'frames_evicted',  # 缓存满时被挤出的帧数
+    'chunks_dropped',  # 读取与解码分线程时，解码跟不上、队列满而丢弃的已读数据块数
+    'frames_output',  # 经抽取后送入缓存的帧数
+    'frames_decimated',  # 被抽取策略丢弃的帧数
+    'frames_merged',  # 被平均进其他帧的帧数
+)
+
+
+class AcquisitionStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = {}  # 名称 -> 无参函数，读取时求值
+        # 速率：frames_decoded -> fps；frames_output -> output_fps；bytes_read -> bytes_per_second
+        self.rates = {'frames_decoded': 0., 'frames_output': 0., 'bytes_read': 0.}
+        self.__window_counts = dict.fromkeys(self.rates, 0)
+        self.__window_begin = time.perf_counter()
+
+    def count(self, name, n=1):
+        """
+        累加计数。可在采集线程中逐包调用
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            if name in self.__window_counts:
+                self.__window_counts[name] += n
+                self.__roll_window(time.perf_counter())
+
+    def add_gauge(self, name, getter):
+        """
+        登记一个读取时才求值的量，如缓存占用
+        """
+        self.gauges[name] = getter
+
+    def __roll_window(self, time_now):
+        elapsed = time_now - self.__window_begin
+        if elapsed >= RATE_WINDOW:
+            for name, value in self.__window_counts.items():
+                self.rates[name] = value / elapsed
+                self.__window_counts[name] = 0
+            self.__window_begin = time_now
+
+    @property
+    def fps(self):
+        return self.snapshot()['fps']
+
+    def snapshot(self) -> dict:
+        """
+        当前所有统计量的一份拷贝
+        """
+        with self.lock:
+            self.__roll_window(time.perf_counter())
+            ret = dict(self.counters)
+            ret['fps'] = self.rates['frames_decoded']
+            ret['output_fps'] = self.rates['frames_output']
+            ret['bytes_per_second'] = self.rates['bytes_read']
+        for name, getter in self.gauges.items():
+            ret[name] = getter()
+        return ret
+
+    def reset(self):
+        with self.lock:
+            for name in self.counters:
+                self.counters[name] = 0
+            for name in self.rates:
+                self.rates[name] = 0.
+                self.__window_counts[name] = 0
+            self.__window_begin = time.perf_counter()
+
+    def __str__(self):
+        return ', '.join(f'{k}: {round(v, 1) if isinstance(v, float) else v}' for k, v in self.snapshot().items())
@@ -0,0 +1,243 @@
+# 采集链路的基准测试：Decoder、trans、SplitDataDict及get_split_driver_class生成的驱动
+# 覆盖config_files中所有config_array布局，bytes_per_point取1和2。输入由PacketGenerator生成，随机数种子固定
+# 用法：python -m backends.benchmark --output bench.json [--compare 上次的bench.json]
+# 每项报告包/s、帧/s、字节/s、每帧的内存分配量（tracemalloc统计）以及单次调用耗时的p50/p99
+
+import os
+import glob
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+from backends.decoding import Decoder
+from backends.simulated_backend import PacketGenerator
+from backends.usb_driver import UsbSensorDriver, CrosstalkCorrection
+from backends.tactile_split import SplitDataDict, get_split_driver_class
+
+CONFIG_FOLDER = os.path.join(os.path.dirname(__file__), '../config_files')
+CHUNK_SIZE = 1024  # 每次送入解码器的字节数，与UsbBackend的MESSAGE_SIZE一致
+REPEAT = 200  # 不以帧流计时的项目，重复调用的次数
+WARMUP_FRAMES = 10  # 解码器统计分配量前先解码的帧数，使各预分配的缓冲达到稳态
+# 解码器稳态下每次调用（送入CHUNK_SIZE字节）分配量的上限(bytes)。稳态下不再有按包数、帧大小分配的数组，
+# 只剩numpy视图、归约等与数据量无关的簿记开销（约2KB），故按调用而非按帧限定
+STEADY_STATE_BYTES_PER_CALL = 4096
+
+
+def load_config(name):
+    return json.load(open(os.path.join(CONFIG_FOLDER, name), 'rt'))
+
+
+def layout_names():
+    return [os.path.basename(path)[len('config_array_'):-len('.json')]
+            for path in sorted(glob.glob(os.path.join(CONFIG_FOLDER, 'config_array_*.json')))]
+
+
+def summarize(latencies, elapsed, frame_count, allocated, package_count=0, byte_count=0):
+    """
+    :param latencies: 各次调用的耗时(ns)
+    :param elapsed: 总耗时(s)
+    :param allocated: tracemalloc统计的分配总量(bytes)
+    """
+    return {
+        'packages_per_second': package_count / elapsed,
+        'frames_per_second': frame_count / elapsed,
+        'bytes_per_second': byte_count / elapsed,
+        'allocated_bytes_per_frame': allocated / max(frame_count, 1),
+        'latency_p50_us': float(np.percentile(latencies, 50)) / 1e3,
+        'latency_p99_us': float(np.percentile(latencies, 99)) / 1e3,
+        'calls': latencies.__len__(),
+    }
+
+
+def measure_allocations(func, calls):
+    """
+    逐次调用func，累加每次调用期间内存占用的峰值增量。可反映临时数组的分配量
+    """
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(calls):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return allocated
+
+
+def timed_calls(func, calls):
+    latencies = np.zeros((calls, ), dtype=np.int64)
+    time_begin = time.perf_counter()
+    for idx in range(calls):
+        t = time.perf_counter_ns()
+        func()
+        latencies[idx] = time.perf_counter_ns() - t
+    return latencies, time.perf_counter() - time_begin
+
+
+def bench_decoder(config_array, frame_count):
+    config_array = dict(config_array, decimation={'mode': 'pass_all'})
+    stream, _ = PacketGenerator(config_array).generate(frame_count)
+    chunks = [stream[begin:begin + CHUNK_SIZE] for begin in range(0, stream.__len__(), CHUNK_SIZE)]
+
+    def run(decoder, chunk):
+        decoder(chunk)
+        while True:
+            frame = decoder.get_frame()
+            if frame is None:
+                break
+            frame.release()
+
+    decoder = Decoder(config_array)
+    latencies = np.zeros((chunks.__len__(), ), dtype=np.int64)
+    time_begin = time.perf_counter()
+    for idx, chunk in enumerate(chunks):
+        t = time.perf_counter_ns()
+        run(decoder, chunk)
+        latencies[idx] = time.perf_counter_ns() - t
+    elapsed = time.perf_counter() - time_begin
+    counters = decoder.stats.snapshot()
+    # 分配量另起一个解码器统计，避免tracemalloc拖慢计时。先解码WARMUP_FRAMES帧，只统计稳态
+    decoder_traced = Decoder(config_array)
+    warmup = chunks.__len__() * WARMUP_FRAMES // frame_count
+    for chunk in chunks[:warmup]:
+        run(decoder_traced, chunk)
+    frames_warmup = decoder_traced.stats.snapshot()['frames_decoded']
+    chunk_iter = iter(chunks[warmup:])
+    allocated = measure_allocations(lambda: run(decoder_traced, next(chunk_iter)), chunks.__len__() - warmup)
+    assert allocated <= STEADY_STATE_BYTES_PER_CALL * (chunks.__len__() - warmup), \
+        f'解码器稳态下每次调用分配{allocated / (chunks.__len__() - warmup):.0f}字节'
+    result = summarize(latencies, elapsed, counters['frames_decoded'], 0,
+                       counters['packages_accepted'], stream.__len__())
+    result['allocated_bytes_per_frame'] = \
+        allocated / max(decoder_traced.stats.snapshot()['frames_decoded'] - frames_warmup, 1)
+    return result
+
+
+def bench_trans(config_array):
+    shape = (config_array['row_array'].__len__(), config_array['column_array'].__len__())
+    trans = CrosstalkCorrection(shape, **(config_array.get('trans') or {}))
+    frame = PacketGenerator(config_array).make_frame(0.)
+    latencies, elapsed = timed_calls(lambda: trans(frame), REPEAT)
+    allocated = measure_allocations(lambda: trans(frame), REPEAT)
+    return summarize(latencies, elapsed, REPEAT, allocated, byte_count=frame.nbytes * REPEAT)
+
+
+def mapping_pairs():
+    # 各config_mapping及其对应的config_array。没有同名config_array的，使用64*64
+    layouts = layout_names()
+    for path in sorted(glob.glob(os.path.join(CONFIG_FOLDER, 'config_mapping_*.json'))):
+        name = os.path.basename(path)[len('config_mapping_'):-len('.json')]
+        yield name, load_config(os.path.basename(path)), \
+            load_config(f'config_array_{name if name in layouts else "64"}.json')
+
+
+def bench_split_data_dict(config_mapping, config_array, packed=False):
+    """
+    :param packed: 为True时一次取出所有分片（SplitDataDict.packed），否则逐个读取
+    """
+    range_mapping = get_split_driver_class(UsbSensorDriver, config_mapping).range_mapping
+    frame = PacketGenerator(config_array).make_frame(0.)
+
+    def run():
+        data = SplitDataDict(frame, range_mapping)
+        if packed:
+            return data.packed
+        for _ in data.values():
+            pass
+
+    latencies, elapsed = timed_calls(run, REPEAT)
+    allocated = measure_allocations(run, REPEAT)
+    return summarize(latencies, elapsed, REPEAT, allocated, byte_count=frame.nbytes * REPEAT)
+
+
+def bench_split_driver(config_mapping, config_array, frame_count):
+    # 驱动不连接硬件，包流直接写入其解码器，只测驱动一侧的get
+    config_array = dict(config_array, decimation={'mode': 'pass_all'}, simulation={})
+    shape = (config_array['row_array'].__len__(), config_array['column_array'].__len__())
+
+    class BenchmarkDriver(UsbSensorDriver):
+        SENSOR_SHAPE = shape
+
+        def __init__(self):
+            super().__init__(self.SENSOR_SHAPE, config_array)
+
+    driver = get_split_driver_class(BenchmarkDriver, config_mapping)()
+    generator = PacketGenerator(config_array)
+    frames = [generator.encode(generator.make_frame(idx * 0.01)).copy() for idx in range(frame_count + 1)]
+    decoder = driver.sensor_backend.decoder
+
+    def run(driver, frame_iter):
+        decoder = driver.sensor_backend.decoder
+        decoder(next(frame_iter))
+        data, t = driver.get()
+        for _ in data.values():
+            pass
+
+    decoder(frames[0])
+    frame_iter = iter(frames[1:])
+    latencies, elapsed = timed_calls(lambda: run(driver, frame_iter), frame_count)
+    driver_traced = get_split_driver_class(BenchmarkDriver, config_mapping)()
+    driver_traced.sensor_backend.decoder(frames[0])
+    frame_iter = iter(frames[1:])
+    allocated = measure_allocations(lambda: run(driver_traced, frame_iter), frame_count)
+    return summarize(latencies, elapsed, frame_count, allocated,
+                     decoder.stats.snapshot()['packages_accepted'], sum(_.nbytes for _ in frames[1:]))
+
+
+def run_all(frame_count):
+    results = {}
+    for name in layout_names():
+        config_array = load_config(f'config_array_{name}.json')
+        for bytes_per_point in [1, 2]:
+            config_this = dict(config_array, bytes_per_point=bytes_per_point)
+            results[f'decoder/{name}/bpp{bytes_per_point}'] = bench_decoder(config_this, frame_count)
+        results[f'trans/{name}'] = bench_trans(config_array)
+    for name, config_mapping, config_array in mapping_pairs():
+        results[f'split_data_dict/{name}'] = bench_split_data_dict(config_mapping, config_array)
+        results[f'split_data_dict_packed/{name}'] = bench_split_data_dict(config_mapping, config_array, True)
+        results[f'split_driver/{name}'] = bench_split_driver(config_mapping, config_array, frame_count)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare(old, new):
+    # 打印帧/s与p99耗时的相对变化
+    for key, value in new['results'].items():
+        if key in old['results']:
+            value_old = old['results'][key]
+            fps_change = value['frames_per_second'] / max(value_old['frames_per_second'], 1e-9) - 1.
+            p99_change = value['latency_p99_us'] / max(value_old['latency_p99_us'], 1e-9) - 1.
+            print(f'{key}: 帧/s {fps_change:+.1%}, p99 {p99_change:+.1%}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', default=None, help='与之对比的历史结果')
+    parser.add_argument('--frames', type=int, default=100, help='每项测试的帧数')
+    args = parser.parse_args()
+    report = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'numpy': np.__version__,
+        'frames': args.frames,
+        'results': run_all(args.frames),
+    }
+    for key, value in report['results'].items():
+        print(f'{key}: {value["packages_per_second"]:.0f} 包/s, {value["frames_per_second"]:.0f} 帧/s, '
+              f'{value["bytes_per_second"] / 1e6:.2f} MB/s, 每帧分配{value["allocated_bytes_per_frame"]:.0f}字节, '
+              f'p50 {value["latency_p50_us"]:.1f}us, p99 {value["latency_p99_us"]:.1f}us')
+    json.dump(report, open(args.output, 'wt'), indent=2)
+    if args.compare:
+        compare(json.load(open(args.compare, 'rt')), report)
@@ -12,6 +12,7 @@ config_can = json.load(open(os.path.join(os.path.dirname(__file__), '../config_f
 device_index = int(config_can['device_index'])
 channel_index = int(config_can['channel_index'])
 baud_rate = int(config_can['baud_rate'])
+debug = bool(config_can.get('debug', False))  # 打印收到的每一帧
 
 
 class CanBackend:
@@ -22,6 +23,7 @@ class CanBackend:
         # 解包
         self.decoder = Decoder(config_array)
         self.err_queue = deque(maxlen=1)
+        self.stats = self.decoder.stats
         #
         self.active = False
 
@@ -29,7 +31,7 @@ class CanBackend:
         try:
             self.can.connect()
             self.active = True
-            threading.Thread(target=self.read_forever, args=(0.05, ), daemon=True).start()
+            threading.Thread(target=self.read_forever, args=(MAX_WAIT, ), daemon=True).start()
             return True
         except Exception as e:
             print('Failed to connect to CAN device')
@@ -39,26 +41,28 @@ class CanBackend:
         self.active = False
         return True
 
-    def read_forever(self, interval):
+    def read_forever(self, max_wait):
+        # 收到数据即交给解码；无数据时逐步延长等待，最长max_wait，避免空转占满CPU
+        wait = MIN_WAIT
         while self.active:
-            start_time = time.time()
-            while True:
-                time_now = time.time()
-                if time_now - start_time < interval:
-                    self.can.communicate()
-                else:
-                    self.read()
-                    start_time = time_now
+            if self.read():
+                wait = MIN_WAIT
+            else:
+                time.sleep(wait)
+                wait = min(wait * 2, max_wait)
 
     def read(self):
         try:
-            last_message = self.can.read()
+            last_message = self.can.communicate()
+            capture_ns = time.perf_counter_ns()
         except Exception as e:
             self.stop()
             self.err_queue.append(e)
             print(e)
             raise Exception('CAN read/write failed')
-        self.decoder(last_message)
+        if last_message.__len__():
+            self.decoder(last_message, capture_ns)
+        return last_message.__len__()
 
     def get(self):
         return self.decoder.get()
@@ -66,8 +70,17 @@ class CanBackend:
     def get_last(self):
         return self.decoder.get_last()
 
+    def get_frame(self):
+        return self.decoder.get_frame()
+
+    def get_last_frame(self):
+        return self.decoder.get_last_frame()
+
 
 LEN = 2500
+MIN_WAIT = 0.0005
+MAX_WAIT = 0.005
+DATA_INDICES = np.arange(8).reshape((1, -1))
 
 
 class CanDevice:
@@ -102,10 +115,11 @@ class CanDevice:
         def __init__(self, num_of_structs):
             super().__init__()
             # 这个括号不能少
-            self.STRUCT_ARRAY = cast((CanDevice.VCI_CAN_OBJ * num_of_structs)(),
-                                     POINTER(CanDevice.VCI_CAN_OBJ))  # 结构体数组
+            self.BUFFER = (CanDevice.VCI_CAN_OBJ * num_of_structs)()
+            self.STRUCT_ARRAY = cast(self.BUFFER, POINTER(CanDevice.VCI_CAN_OBJ))  # 结构体数组
             self.SIZE = num_of_structs  # 结构体长度
             self.ADDR = self.STRUCT_ARRAY[0]  # 结构体数组地址  byref()转c地址
+            self.VIEW = np.ctypeslib.as_array(self.BUFFER)  # 同一块内存的numpy结构化数组视图
 
     def __init__(self):
         CanDLLName = os.path.join(os.path.dirname(__file__), '../extern/ControlCAN.dll')  # 把DLL放到对应的目录下
@@ -114,7 +128,6 @@ class CanDevice:
         # canDLL = cdll.LoadLibrary('./libcontrolcan.so')
         self.rx_vci_can_obj = CanDevice.VCI_CAN_OBJ_ARRAY(LEN)  # 结构体数组
         print(CanDLLName)
-        self.data_storage = deque(maxlen=LEN)
         self.communicate_thread = threading.Thread(target=self.communicate_forever, daemon=True)
         self.activated = False
 
@@ -155,27 +168,25 @@ class CanDevice:
         self.activated = False
         self.communicate_thread = threading.Thread(target=self.communicate_forever, daemon=True)
 
-    def read(self):
-        # 取走self.data_storage里的数据
-        ret_all = self.data_storage
-        self.data_storage = deque(maxlen=LEN)
-        return ret_all
-
     def communicate_forever(self):
         pass
 
     def communicate(self):
+        """
+        取出驱动中已收到的所有CAN帧
+        :return: 按顺序拼接的各帧Data[:DataLen]，uint8数组
+        """
         f = self.canDLL.VCI_Receive(self.VCI_USBCAN2, device_index, channel_index,
                                     byref(self.rx_vci_can_obj.ADDR), LEN, 0)
         if f > 0:  # 接收到数据
-            for i in range(f):
-                # if self.rx_vci_can_obj.STRUCT_ARRAY[i].ID == 0:
-                ret = list(self.rx_vci_can_obj.STRUCT_ARRAY[i].Data)[:self.rx_vci_can_obj.STRUCT_ARRAY[i].DataLen]
-                print(f'ID{self.rx_vci_can_obj.STRUCT_ARRAY[i].ID}: ',  '\t'.join([hex(_) for _ in ret]))
-                self.data_storage.extend(ret)
-                # print(ret)
-        # else:
-        #     time.sleep(0.001)
+            received = self.rx_vci_can_obj.VIEW[:f]
+            data = received['Data'][DATA_INDICES < received['DataLen'].reshape((-1, 1))]
+            if debug:
+                for can_id, data_len, data_this in zip(received['ID'], received['DataLen'], received['Data']):
+                    print(f'ID{can_id}: ', '\t'.join([hex(_) for _ in data_this[:data_len]]))
+            return data
+        else:
+            return np.empty(0, dtype=np.uint8)
 
 
 if __name__ == '__main__':
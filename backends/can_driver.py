@@ -1,6 +1,7 @@
 from backends.abstract_sensor_driver import SensorDriver
 import json
 from backends.can_backend import CanBackend
+from backends.simulated_backend import SimulatedBackend
 import os
 
 
@@ -12,12 +13,19 @@ class CanSensorDriver(SensorDriver):
     def __init__(self, sensor_shape, config_array):
         super(CanSensorDriver, self).__init__()
         self.SENSOR_SHAPE = sensor_shape
-        self.sensor_backend = CanBackend(config_array)  # 后端自带缓存，一定范围内不丢数据
+        if config_array.get('simulation') is not None:
+            self.sensor_backend = SimulatedBackend(config_array)  # 无硬件时的模拟采集卡
+        else:
+            self.sensor_backend = CanBackend(config_array)  # 后端自带缓存，一定范围内不丢数据
 
     @property
     def connected(self):
         return self.sensor_backend.active
 
+    @property
+    def stats(self):
+        return self.sensor_backend.stats
+
     def connect(self, port):
         return self.sensor_backend.start(port)
 
@@ -36,6 +44,16 @@ class CanSensorDriver(SensorDriver):
         data, t = self.sensor_backend.get_last()
         return data, t
 
+    def get_frame(self):
+        if self.sensor_backend.err_queue:
+            raise self.sensor_backend.err_queue.popleft()
+        return self.sensor_backend.get_frame()
+
+    def get_last_frame(self):
+        if self.sensor_backend.err_queue:
+            raise self.sensor_backend.err_queue.popleft()
+        return self.sensor_backend.get_last_frame()
+
 
 class Can16SensorDriver(CanSensorDriver):
 
@@ -0,0 +1,151 @@
+# 帧抽取策略。解码器每完成一帧，交由抽取策略决定输出哪些帧
+# 在config_array中配置，形如"decimation": {"mode": "fixed_rate", "interval": 0.01}
+# 未配置时为fixed_rate、间隔0.01s，即原先Decoder.MINIMUM_INTERVAL的行为
+
+import numpy as np
+
+DEFAULT_MODE = 'fixed_rate'
+DEFAULT_INTERVAL = 0.01
+
+
+class Decimation:
+    # pass_all：每帧都输出
+
+    def __init__(self, stats, frame_pool, interval=0.):
+        self.stats = stats
+        self.frame_pool = frame_pool
+        self.interval = interval
+
+    def __call__(self, time_now, assemble):
+        """
+        :param time_now: 帧完成的时间
+        :param assemble: 以time_now为参数，组装并返回该帧（PooledFrame）。丢弃的帧可不组装
+        :return: 需输出的PooledFrame或None
+        """
+        return assemble(time_now)
+
+
+class FixedRateDecimation(Decimation):
+    # fixed_rate：距上次输出不足interval的帧直接丢弃
+
+    def __init__(self, stats, frame_pool, interval=DEFAULT_INTERVAL):
+        super().__init__(stats, frame_pool, interval)
+        self.last_output_time = 0.
+
+    def __call__(self, time_now, assemble):
+        if time_now - self.last_output_time >= self.interval:
+            self.last_output_time = time_now
+            return assemble(time_now)
+        else:
+            self.stats.count('frames_decimated')
+            return None
+
+
+class KeepLatestDecimation(Decimation):
+    # keep_latest：每个interval内只输出最新的一帧
+    # 需等到下一个interval的首帧到来，才能确定上一个interval的最新帧，因此输出晚一帧
+
+    def __init__(self, stats, frame_pool, interval=DEFAULT_INTERVAL):
+        super().__init__(stats, frame_pool, interval)
+        self.pending = None
+        self.window_begin = 0.
+
+    def __call__(self, time_now, assemble):
+        frame = assemble(time_now)
+        if self.pending is None:
+            self.window_begin = time_now
+            output = None
+        elif time_now - self.window_begin >= self.interval:
+            self.window_begin = time_now
+            output = self.pending
+        else:
+            self.pending.release()
+            self.stats.count('frames_decimated')
+            output = None
+        self.pending = frame
+        return output
+
+
+class AverageDecimation(Decimation):
+    # average：每个interval内的帧取平均（boxcar），输出一帧。同样晚一帧输出
+
+    def __init__(self, stats, frame_pool, interval=DEFAULT_INTERVAL):
+        super().__init__(stats, frame_pool, interval)
+        shape = frame_pool.frames.shape[1:]
+        self.summed = np.zeros(shape, dtype=float)
+        self.count = 0
+        self.window_begin = 0.
+        self.last_time = 0.
+
+    def __call__(self, time_now, assemble):
+        output = None
+        if self.count and time_now - self.window_begin >= self.interval:
+            output = self.__emit()
+        with assemble(time_now) as frame:
+            if self.count == 0:
+                self.window_begin = time_now
+                self.summed[...] = frame.data
+            else:
+                self.summed += frame.data
+        self.count += 1
+        self.last_time = time_now
+        return output
+
+    def __emit(self):
+        frame = self.frame_pool.acquire()
+        self.summed /= self.count
+        np.rint(self.summed, out=self.summed)
+        frame.data[...] = self.summed
+        frame.t = self.last_time
+        self.stats.count('frames_merged', self.count - 1)
+        self.count = 0
+        return frame
+
+
+MODES = {
+    'pass_all': Decimation,
+    'fixed_rate': FixedRateDecimation,
+    'keep_latest': KeepLatestDecimation,
+    'average': AverageDecimation,
+}
+
+
+def build_decimation(config_array, stats, frame_pool):
+    config = config_array.get('decimation', {})
+    mode = config.get('mode', DEFAULT_MODE)
+    if mode not in MODES:
+        raise ValueError(f'Unsupported decimation mode: {mode}')
+    return MODES[mode](stats, frame_pool, config.get('interval', DEFAULT_INTERVAL))
+
+
+if __name__ == '__main__':
+    # 各模式下的输出帧率上限，以及每帧的开销
+    import time
+    from backends.acquisition_stats import AcquisitionStats
+    from backends.decoding import FramePool
+
+    frame_pool = FramePool((64, 64), np.int16, 16)
+    source = np.random.default_rng(0).integers(-1000, 1000, (64, 64)).astype(np.int16)
+
+    def assemble(time_now):
+        frame = frame_pool.acquire()
+        frame.data[...] = source
+        frame.t = time_now
+        return frame
+
+    duration = 2.  # 模拟的采集时长(s)
+    for mode in MODES:
+        for input_fps in [50, 100, 500, 2000]:
+            stats = AcquisitionStats()
+            decimation = MODES[mode](stats, frame_pool, DEFAULT_INTERVAL)
+            output_count = 0
+            time_begin = time.perf_counter()
+            for time_now in np.arange(1., 1. + duration, 1. / input_fps):
+                frame = decimation(float(time_now), assemble)
+                if frame is not None:
+                    output_count += 1
+                    frame.release()
+            cost = (time.perf_counter() - time_begin) / (duration * input_fps)
+            counters = stats.snapshot()
+            print(f'{mode}, 输入{input_fps}帧/s: 输出{output_count / duration:.1f}帧/s, '
+                  f'丢弃{counters["frames_decimated"]}, 合并{counters["frames_merged"]}, 每帧{cost * 1e6:.1f}us')
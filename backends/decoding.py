@@ -1,21 +1,272 @@
 # 通用的解码程序
 
 import time
+import threading
 import warnings
 
 import numpy as np
-import crcmod.predefined
 from collections import deque
-
-crc = crcmod.predefined.mkCrcFun('crc-ccitt-false')
+from backends.acquisition_stats import AcquisitionStats
+from backends.decimation import build_decimation
 
 HEAD_LENGTH = 6
+HEAD_BYTES = (np.uint8(0xaa), np.uint8(0x10), np.uint8(0x33))  # 包头的前三位
 CRC_LENGTH = 2
+CRC_POLY = 0x1021
+CRC_INIT = 0xffff
+# perf_counter_ns与time.time()的差，进程内只取一次。帧时间由采集时刻的perf_counter_ns换算，与time.time()对齐且单调
+EPOCH_OFFSET = time.time() - time.perf_counter_ns() * 1e-9
 
 
-class Decoder:
+class FrameTime(float):
+    # 帧的时间戳(s)，可当作time.time()的值使用
+    # 另附采集时刻的perf_counter_ns（ns）及包头中的8位帧号（frame_number，未知时为-1）。参与运算后即为普通float
+
+    __slots__ = ('ns', 'frame_number')
+
+    def __new__(cls, ns, frame_number=-1):
+        self = super().__new__(cls, ns * 1e-9 + EPOCH_OFFSET)
+        self.ns = ns
+        self.frame_number = frame_number
+        return self
+
+    def __reduce__(self):
+        return FrameTime, (self.ns, self.frame_number)
+
+
+class CrcValidator:
+    # 批量CRC-CCITT-FALSE校验
+    # CRC对消息是仿射的：crc(m) = crc(全零) ^ XOR_j T[j, m[j]]，T[j, v]为第j个字节取v时的贡献
+    # 预计算T后，多个包的校验只需一次查表和一次异或归约
+    # 下标、查表结果等中间数组按见过的最大包数预分配，稳态下校验不再分配数组
+
+    def __init__(self, data_length):
+        self.data_length = data_length
+        byte_table = np.zeros((256, ), dtype=np.uint16)  # 标准的按字节查表
+        for v in range(256):
+            c = v << 8
+            for _ in range(8):
+                c = ((c << 1) ^ CRC_POLY) if c & 0x8000 else (c << 1)
+            byte_table[v] = c & 0xffff
+        self.position_table = np.zeros((data_length, 256), dtype=np.uint16)
+        contribution = byte_table.copy()  # 最后一个字节的贡献
+        for j in range(data_length - 1, -1, -1):
+            self.position_table[j] = contribution
+            # 其后多一个零字节
+            contribution = ((contribution << 8) & 0xffff) ^ byte_table[contribution >> 8]
+        self.position_offset = (np.arange(data_length, dtype=np.intp) * 256).reshape((1, -1))
+        self.position_table = self.position_table.reshape(-1)
+        crc_of_zeros = CRC_INIT
+        for _ in range(data_length):
+            crc_of_zeros = ((crc_of_zeros << 8) & 0xffff) ^ int(byte_table[crc_of_zeros >> 8])
+        self.crc_of_zeros = np.uint16(crc_of_zeros)
+        self.capacity = 0
+        self.offsets = None  # (capacity, data_length)，各行均为position_offset。广播的操作数会使ufunc分配缓冲，故展开
+        self.index = None  # (capacity, data_length)，各字节在position_table中的位置
+        self.looked_up = None  # (capacity, data_length)，各字节的贡献
+        self.crc = None  # (capacity, )
+        self.passed = None  # (capacity, )
+
+    def reserve(self, package_count):
+        # 保证中间数组能容纳package_count个包
+        if package_count > self.capacity:
+            self.capacity = package_count
+            self.offsets = np.repeat(self.position_offset, package_count, axis=0)
+            self.index = np.zeros((package_count, self.data_length), dtype=np.intp)
+            self.looked_up = np.zeros((package_count, self.data_length), dtype=np.uint16)
+            self.crc = np.zeros((package_count, ), dtype=np.uint16)
+            self.passed = np.zeros((package_count, ), dtype=bool)
+
+    def calculate(self, data):
+        """
+        :param data: (包数, data_length)的uint8数组
+        :return: 各包的CRC。为内部数组的视图，下一次调用后失效
+        """
+        count = data.shape[0]
+        self.reserve(count)
+        index = self.index[:count]
+        # 先原样转为intp，再与同dtype的offsets相加。混合dtype的ufunc会分配转换缓冲
+        np.copyto(index, data)
+        np.add(index, self.offsets[:count], out=index)
+        # mode='raise'时out总会经过缓冲；下标必在范围内，用'clip'
+        looked_up = np.take(self.position_table, index, out=self.looked_up[:count], mode='clip')
+        crc = np.bitwise_xor.reduce(looked_up, axis=1, out=self.crc[:count])
+        np.bitwise_xor(crc, self.crc_of_zeros, out=crc)
+        return crc
+
+    def __call__(self, packages):
+        """
+        :param packages: (包数, data_length + CRC_LENGTH)的uint8数组，CRC为大端
+        :return: 各包是否通过校验。为内部数组的视图，下一次调用后失效
+        """
+        # 收到的CRC直接以大端uint16的视图读取，不复制
+        crc_received = packages[:, self.data_length:self.data_length + CRC_LENGTH].view('>u2')[:, 0]
+        crc = self.calculate(packages[:, :self.data_length])
+        return np.equal(crc, crc_received, out=self.passed[:packages.shape[0]])
+
+
+class ByteRingBuffer:
+    # 定长字节缓存。有效数据总是连续存放，可直接以视图读取；写满时丢弃最早的字节
+
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = capacity
+        self.storage = np.zeros((capacity * 2, ), dtype=np.uint8)  # 留出余量，减少整理次数
+        self.head = 0
+        self.tail = 0
+
+    def __len__(self):
+        return self.tail - self.head
+
+    @property
+    def free(self):
+        return self.capacity - self.__len__()
+
+    def write(self, data):
+        """
+        写入数据
+        :param data: 一维uint8数组或支持缓冲协议的对象
+        :return: 因溢出而丢弃的字节数
+        """
+        data = as_bytes(data)
+        length = data.__len__()
+        dropped = max(0, self.__len__() + length - self.capacity)
+        if length >= self.capacity:
+            data = data[length - self.capacity:]
+            length = self.capacity
+            self.head = self.tail = 0
+        elif dropped:
+            self.head += dropped
+        if self.tail + length > self.storage.__len__():
+            # 将剩余数据搬到开头
+            remaining = self.__len__()
+            self.storage[:remaining] = self.storage[self.head:self.tail]
+            self.head, self.tail = 0, remaining
+        self.storage[self.tail:self.tail + length] = data
+        self.tail += length
+        return dropped
+
+    def view(self):
+        # 有效数据的视图。下一次write之后失效
+        return self.storage[self.head:self.tail]
+
+    def consume(self, length):
+        self.head = min(self.head + length, self.tail)
+        if self.head == self.tail:
+            self.head = self.tail = 0
+
+    def clear(self):
+        self.head = self.tail = 0
+
+
+class PooledFrame:
+    # 帧池中的一帧。使用者retain/release，引用计数归零时回到池中，data随后会被覆盖
+
+    def __init__(self, pool, idx, data):
+        self.pool = pool
+        self.idx = idx  # 为-1时是池耗尽时临时分配的帧，不回收
+        self.data = data
+        self.t = None  # FrameTime
+        self.ref_count = 0
+
+    def retain(self):
+        self.pool.retain(self)
+        return self
+
+    def release(self):
+        self.pool.release(self)
+
+    def detach(self):
+        # 取出一份归调用者所有的数据，并释放本帧
+        data = self.data if self.idx < 0 else self.data.copy()
+        self.release()
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class FramePool:
+    # 预分配的定长帧池。稳态下解码不再为每帧分配数组
+
+    def __init__(self, shape, dtype, size):
+        self.frames = np.zeros((size, ) + tuple(shape), dtype=dtype)
+        self.slots = [PooledFrame(self, idx, self.frames[idx]) for idx in range(size)]
+        self.free_slots = deque(self.slots)
+        self.lock = threading.Lock()
+        self.exhausted_count = 0  # 池耗尽、临时分配的次数
+
+    @property
+    def in_use(self):
+        return self.slots.__len__() - self.free_slots.__len__()
+
+    def acquire(self):
+        with self.lock:
+            if self.free_slots:
+                frame = self.free_slots.popleft()
+                frame.ref_count = 1
+                return frame
+            self.exhausted_count += 1
+        frame = PooledFrame(self, -1, np.zeros(self.frames.shape[1:], dtype=self.frames.dtype))
+        frame.ref_count = 1
+        return frame
+
+    def retain(self, frame):
+        with self.lock:
+            assert frame.ref_count > 0
+            frame.ref_count += 1
+
+    def release(self, frame):
+        with self.lock:
+            assert frame.ref_count > 0
+            frame.ref_count -= 1
+            if frame.ref_count == 0 and frame.idx >= 0:
+                self.free_slots.append(frame)
+
+
+def build_frame_plan(row_array, column_array, extra_swap=()):
+    """
+    frame_plan[目标点位] = 源点位。源点位按(包号, 包内点号)展开；行、列的重排及extra_swap都合并在内
+    未被任何包写入的点位，取值为点位总数
+    """
+    row_count, column_count = row_array.__len__(), column_array.__len__()
+    sentinel = row_count * column_count
+    frame_plan = np.full((row_count * column_count, ), sentinel, dtype=np.intp)
+    for package_number in range(row_count):
+        row = row_array[package_number]
+        frame_plan[row * column_count:(row + 1) * column_count] \
+            = package_number * column_count + np.array(column_array, dtype=np.intp)
+    for (row_0, col_0), (row_1, col_1) in extra_swap:
+        idx_0 = row_0 * column_count + col_0
+        idx_1 = row_1 * column_count + col_1
+        frame_plan[idx_0], frame_plan[idx_1] = frame_plan[idx_1], frame_plan[idx_0]
+    return frame_plan
 
-    MINIMUM_INTERVAL = 0.01
+
+def count_leading(mask):
+    # 一维bool数组开头连续为True的个数。只做一次归约，不生成中间数组
+    if not mask.__len__():
+        return 0
+    idx = int(np.argmin(mask))
+    return mask.__len__() if mask[idx] else idx
+
+
+def as_bytes(message):
+    # 尽量不复制地将消息转为uint8数组。array('B')、bytes、bytearray等直接共享内存
+    if isinstance(message, np.ndarray):
+        if message.dtype == np.uint8 and message.ndim == 1:
+            return message
+        return np.asarray(message, dtype=np.uint8).reshape(-1)
+    try:
+        return np.frombuffer(message, dtype=np.uint8)
+    except TypeError:
+        return np.array(message, dtype=np.uint8)
+
+
+class Decoder:
 
     def __init__(self, config_array):
         self.row_array = config_array['row_array']
@@ -26,58 +277,162 @@ class Decoder:
         self.extra_swap = config_array.get('extra_swap', [])
         self.sensor_shape = (self.row_array.__len__(), self.column_array.__len__())
         self.package_size = HEAD_LENGTH + CRC_LENGTH + self.sensor_shape[1] * self.bytes_per_point
+        self.crc_check = config_array.get('crc_check', True)  # 默认开启
+        self.crc_validator = CrcValidator(self.package_size - CRC_LENGTH)
         #
-        self.preparing_frame \
-            = [np.zeros((self.sensor_shape[0] * self.sensor_shape[1], ), dtype=np.uint8)
-               for _ in range(self.bytes_per_point)]
-        self.finished_frame \
-            = [np.zeros((self.sensor_shape[0] * self.sensor_shape[1], ), dtype=np.uint8)
-               for _ in range(self.bytes_per_point)]
-        self.last_finish_time = 0.
+        # 按包号存放的原始载荷。帧完成时，经frame_plan一次重排为传感器空间顺序
+        self.preparing_packages = np.zeros((self.sensor_shape[0], self.sensor_shape[1] * self.bytes_per_point),
+                                           dtype=np.uint8)
+        self.raw_dtype = np.dtype('>i2') if self.bytes_per_point == 2 else np.dtype(np.int8)
+        self.frame_plan = build_frame_plan(self.row_array, self.column_array, self.extra_swap)
+        self.raw_values = np.zeros((self.frame_plan.__len__() + 1, ), dtype=np.int16)  # 按本机字节序展开的载荷，末尾为0
         self.last_frame_number = None
         self.last_package_number = None
-        self.buffer = deque(maxlen=self.buffer_length)
-        self.message_cache = np.empty(0, dtype=np.uint8)
+        self.capture_ns = 0  # 当前消息读到的时刻
+        self.frame_capture_ns = 0  # 当前帧最近一个包读到的时刻，即帧的采集时刻
+        self.buffer = deque(maxlen=self.buffer_length)  # 存放PooledFrame
+        # 帧池需容纳缓存中的帧、正在写入的帧以及使用者尚未释放的帧
+        self.frame_pool = FramePool(self.sensor_shape, np.int16,
+                                    config_array.get('frame_pool_size', self.buffer_length + 8))
+        self.stats = AcquisitionStats()
+        # 帧完成后由抽取策略决定是否送入缓存
+        self.decimation = build_decimation(config_array, self.stats, self.frame_pool)
         self.max_cache_length = self.package_size * self.buffer_length
+        self.message_cache = ByteRingBuffer(self.max_cache_length)
+        # 逐次解析所用的中间数组，按缓存容量预分配，稳态下解析不再分配数组
+        # 一段首尾相接的包至多为缓存所能容纳的包数
+        self.crc_validator.reserve(self.buffer_length)
+        self.head_mask = np.zeros((self.max_cache_length, ), dtype=bool)  # 各位置是否为包头
+        self.head_mask_temp = np.zeros((self.max_cache_length, ), dtype=bool)
+        self.all_passed = np.ones((self.buffer_length, ), dtype=bool)  # 不做CRC校验时的结果
+        self.package_sequence = np.arange(self.sensor_shape[0], dtype=np.uint8)  # 包号0, 1, ...
+        self.matched = np.zeros((self.sensor_shape[0], ), dtype=bool)
+        self.matched_temp = np.zeros((self.sensor_shape[0], ), dtype=bool)
         #
         self.warn_info = ''
+        # 统计
+        self.stats.add_gauge('buffer_occupancy', self.buffer.__len__)
+        self.stats.add_gauge('buffer_length', lambda: self.buffer_length)
+        self.stats.add_gauge('cache_bytes', self.message_cache.__len__)
+        self.stats.add_gauge('frame_pool_in_use', lambda: self.frame_pool.in_use)
+        self.stats.add_gauge('frame_pool_exhausted', lambda: self.frame_pool.exhausted_count)
+        self.resyncing = False  # 正在跳过字节寻找包头
 
-    def __call__(self, message):
-        self.message_cache = np.concatenate((self.message_cache, np.array(message, dtype=np.uint8)), axis=0)
-        #
-        offset = 0
-        while offset + self.package_size <= self.message_cache.__len__():
-            # 校验前三位为[0xaa, 0x10, 0x33]
-            if self.message_cache[offset + 0] == 0xaa\
-                    and self.message_cache[offset + 1] == 0x10\
-                    and self.message_cache[offset + 2] == 0x33:
-                # 包头效验正确
-                frame_number = self.message_cache[offset + 4]
-                package_number = self.message_cache[offset + 5]
-                data = self.message_cache[offset:offset + HEAD_LENGTH + self.sensor_shape[1] * self.bytes_per_point]
-                crc_received = \
-                    self.message_cache[offset + HEAD_LENGTH + self.sensor_shape[1] * self.bytes_per_point
-                                       :offset + HEAD_LENGTH + CRC_LENGTH + self.sensor_shape[1] * self.bytes_per_point]
-                crc_calculated = self.__calculate_crc(data)
-                if False and crc_received[0].astype(np.uint16) * 256 + crc_received[1].astype(np.uint16) != crc_calculated:
-                    self.warn_info = 'CRC check failed'
-                    flag = False
-                else:
-                    flag = self.__validate_package(frame_number, package_number)
-
-                if flag:
-                    self.__write_data(self.message_cache, offset, package_number)
-                    offset += self.package_size
-                else:
-                    offset += 1
-            else:
-                offset += 1
-        self.message_cache = self.message_cache[offset:]
-        self.message_cache = self.message_cache[-self.max_cache_length:]
+    def __call__(self, message, capture_ns=None):
+        """
+        :param message: 读到的字节
+        :param capture_ns: 读到message时的time.perf_counter_ns()，应紧接着读取调用取得。为None时取当前时刻
+        """
+        self.capture_ns = time.perf_counter_ns() if capture_ns is None else capture_ns
+        message = as_bytes(message)
+        self.stats.count('bytes_read', message.__len__())
+        # 超出缓存空余的部分分批写入并解析，与先整体拼接再解析的结果相同
+        begin = 0
+        while begin < message.__len__():
+            length = min(self.message_cache.free, message.__len__() - begin)
+            self.message_cache.write(message if length == message.__len__() else message[begin:begin + length])
+            begin += length
+            self.message_cache.consume(self.__decode_cache(self.message_cache.view()))
         if self.warn_info:
             print(self.warn_info)
             self.warn_info = ''
 
+    def __decode_cache(self, cache):
+        """
+        解析缓存中的所有完整包
+        :return: 已处理完、可丢弃的字节数
+        """
+        offset = 0
+        # 一次性找出所有可能的包头位置（校验前三位为[0xaa, 0x10, 0x33]，且其后有完整的包）
+        is_head = self.__find_heads(cache)
+        while offset < is_head.__len__():
+            # 下一个包头。argmax取首个True，不生成下标数组
+            rest = is_head[offset:]
+            begin = int(np.argmax(rest))
+            if not rest[begin]:
+                break
+            begin += offset
+            # 以begin为起点、间隔恰为package_size的连续包头构成一段。整段一次性校验、写入
+            run_length = count_leading(is_head[begin::self.package_size])
+            self.__skip_bytes(begin - offset)
+            offset = self.__decode_run(cache, begin, run_length)
+        # 其余位置不可能构成完整的包，与逐字节扫描相同，移动到末尾
+        end = max(offset, cache.__len__() - self.package_size + 1)
+        self.__skip_bytes(end - offset)
+        return end
+
+    def __skip_bytes(self, length):
+        # 统计失步
+        if length > 0:
+            if not self.resyncing:
+                self.resyncing = True
+                self.stats.count('header_resyncs')
+            self.stats.count('bytes_skipped', length)
+
+    def __find_heads(self, message):
+        # 标记每个能容纳完整包的位置上是否为包头
+        # 结果为head_mask的视图，下一次调用后失效
+        count = max(message.__len__() - self.package_size + 1, 0)
+        is_head = np.equal(message[0:count], HEAD_BYTES[0], out=self.head_mask[:count])
+        temp = self.head_mask_temp[:count]
+        np.logical_and(is_head, np.equal(message[1:count + 1], HEAD_BYTES[1], out=temp), out=is_head)
+        np.logical_and(is_head, np.equal(message[2:count + 2], HEAD_BYTES[2], out=temp), out=is_head)
+        return is_head
+
+    def __decode_run(self, message, begin, run_length):
+        """
+        处理一段首尾相接的包
+        :return: 下一次扫描的起点
+        """
+        packages = message[begin:begin + run_length * self.package_size].reshape((run_length, self.package_size))
+        frame_numbers = packages[:, 4]
+        package_numbers = packages[:, 5]
+        crc_passed = self.crc_validator(packages) if self.crc_check else self.all_passed[:run_length]
+        idx = 0
+        while idx < run_length:
+            # 帧内连续且校验通过的包，不必逐个经过状态机
+            count = self.__count_continuous(frame_numbers[idx:], package_numbers[idx:])
+            if count:
+                count = count_leading(crc_passed[idx:idx + count])
+            if count:
+                self.__write_rows(packages[idx:idx + count], package_numbers[idx:idx + count])
+                self.last_package_number = package_numbers[idx + count - 1]
+                self.stats.count('packages_accepted', count)
+                self.resyncing = False
+                idx += count
+                continue
+            frame_number = frame_numbers[idx]
+            package_number = package_numbers[idx]
+            if not crc_passed[idx]:
+                self.stats.count('crc_failures')
+                self.warn_info = 'CRC check failed'
+                flag = False
+            else:
+                flag = self.__validate_package(frame_number, package_number)
+            if flag:
+                self.__write_data(message, begin + idx * self.package_size, package_number)
+                self.stats.count('packages_accepted')
+                self.resyncing = False
+                idx += 1
+            else:
+                # 包头之后逐字节重新寻找
+                self.stats.count('packages_rejected')
+                self.__skip_bytes(1)
+                return begin + idx * self.package_size + 1
+        return begin + run_length * self.package_size
+
+    def __count_continuous(self, frame_numbers, package_numbers):
+        # 与__validate_package的规则一致：同一帧内，包号逐一递增（不含包号0，它意味着上一帧结束）
+        if self.last_frame_number is None or self.last_package_number is None:
+            return 0
+        begin = int(self.last_package_number) + 1
+        count = max(min(package_numbers.__len__(), self.sensor_shape[0] - begin), 0)
+        matched = np.equal(package_numbers[:count], self.package_sequence[begin:begin + count],
+                           out=self.matched[:count])
+        np.logical_and(matched, np.equal(frame_numbers[:count], self.last_frame_number, out=self.matched_temp[:count]),
+                       out=matched)
+        return count_leading(matched)
+
     def __validate_package(self, frame_number, package_number):
         if self.last_frame_number is None:
             flag = (package_number == 0)
@@ -88,6 +443,8 @@ class Decoder:
                 self.warn_info = ''
         else:
             if package_number == 0:
+                if (int(frame_number) - int(self.last_frame_number)) % 256 != 1:
+                    self.stats.count('frame_number_gaps')
                 if self.last_package_number == self.sensor_shape[0] - 1:
                     self.__finish_frame()
                     flag = True
@@ -110,70 +467,137 @@ class Decoder:
         return flag
 
     def __write_data(self, message, offset, package_number):
-        preparing_cursor = self.sensor_shape[1] * self.row_array[package_number.astype(np.uint16)]
-        begin = preparing_cursor
-        end = preparing_cursor + self.sensor_shape[1]
-        slice_to = slice(begin, end)
-        slices_from = [slice(
-            offset + HEAD_LENGTH + bit,
-            offset + HEAD_LENGTH + self.sensor_shape[1] * self.bytes_per_point + bit,
-            self.bytes_per_point
-        ) for bit in range(self.bytes_per_point)]
-        for bit, slice_from in enumerate(slices_from):
-            self.preparing_frame[bit][slice_to] = message[slice_from][self.column_array]
+        self.frame_capture_ns = self.capture_ns
+        self.preparing_packages[package_number] \
+            = message[offset + HEAD_LENGTH:offset + HEAD_LENGTH + self.sensor_shape[1] * self.bytes_per_point]
+
+    def __write_rows(self, packages, package_numbers):
+        # package_numbers连续递增，整段拷贝
+        begin = int(package_numbers[0])
+        self.frame_capture_ns = self.capture_ns
+        self.preparing_packages[begin:begin + package_numbers.__len__()] \
+            = packages[:, HEAD_LENGTH:HEAD_LENGTH + self.sensor_shape[1] * self.bytes_per_point]
 
     def __finish_frame(self):
-        for bit in range(self.bytes_per_point):
-            self.finished_frame[bit][...] = self.preparing_frame[bit][...]
-        # 交换
-        for extra_swap_pair in self.extra_swap:
-            (row_0, col_0), (row_1, col_1) = extra_swap_pair
-            for bit in range(self.bytes_per_point):
-                # 交换
-                self.finished_frame[bit][row_0 * self.sensor_shape[1] + col_0], \
-                    self.finished_frame[bit][row_1 * self.sensor_shape[1] + col_1] = \
-                    self.finished_frame[bit][row_1 * self.sensor_shape[1] + col_1], \
-                    self.finished_frame[bit][row_0 * self.sensor_shape[1] + col_0]
-        #
-        time_now = time.time()
-        if self.last_finish_time > 0:
-            self.last_interval = time_now - self.last_finish_time
-        if time_now - self.last_finish_time >= self.MINIMUM_INTERVAL:
-            self.last_finish_time = time_now
-            data = sum([(_.astype(np.int8) if bit == 0 else _).astype(np.int16)
-                        * (2 ** (8 * (self.bytes_per_point - bit - 1)))
-                        for bit, _ in enumerate(self.finished_frame)]).reshape(self.sensor_shape)
+        # 此时last_frame_number仍为刚完成的帧的帧号
+        self.stats.count('frames_decoded')
+        frame_time = FrameTime(self.frame_capture_ns, int(self.last_frame_number))
+        frame = self.decimation(frame_time, self.__assemble_frame)
+        if frame is not None:
+            self.stats.count('frames_output')
             # 引入底层滤波器
-            self.buffer.append((data, self.last_finish_time))
+            if self.buffer.__len__() == self.buffer.maxlen:
+                # 缓存已满，最早的帧被挤出，需归还帧池
+                try:
+                    self.buffer.popleft().release()
+                    self.stats.count('frames_evicted')
+                except IndexError:
+                    pass
+            self.buffer.append(frame)
+
+    def __assemble_frame(self, time_now):
+        # 由抽取策略按需调用，被丢弃的帧不做重排
+        frame = self.frame_pool.acquire()
+        self.raw_values[:-1] = self.preparing_packages.view(self.raw_dtype).reshape(-1)
+        # frame_plan的下标必在范围内。mode='raise'时out总会经过缓冲，用'clip'
+        np.take(self.raw_values, self.frame_plan, out=frame.data.reshape(-1), mode='clip')
+        frame.t = time_now
+        return frame
 
     def __abort_frame(self):
-        for bit in range(self.bytes_per_point):
-            self.preparing_frame[bit][...] = 0
+        self.preparing_packages[...] = 0
 
-    @staticmethod
-    def __calculate_crc(data):
-        return crc(data)
+    def get_frame(self):
+        """
+        提取最早的帧，并将其移出缓存。使用完毕后须调用release
+        :return: PooledFrame或None
+        """
+        try:
+            return self.buffer.popleft()
+        except IndexError:
+            return None
 
-    def get(self):
+    def get_last_frame(self):
+        """
+        提取最新的帧，并清空缓存。使用完毕后须调用release
+        :return: PooledFrame或None
+        """
         try:
-            if self.buffer:
-                data, t = self.buffer.popleft()
-                return data, t
-            else:
-                return None, None
-        except Exception as e:
-            raise Exception("Unexpected Exception")
+            frame = self.buffer.pop()
+        except IndexError:
+            return None
+        while True:
+            try:
+                self.buffer.popleft().release()
+            except IndexError:
+                break
+        return frame
+
+    def get(self):
+        frame = self.get_frame()
+        if frame is not None:
+            t = frame.t
+            return frame.detach(), t
+        else:
+            return None, None
 
     def get_last(self):
-        try:
-            if self.buffer:
-                data, t = self.buffer.pop()
-                self.buffer.clear()
-                return data, t
-            else:
-                return None, None
-        except Exception as e:
-            raise Exception("Unexpected Exception")
+        frame = self.get_last_frame()
+        if frame is not None:
+            t = frame.t
+            return frame.detach(), t
+        else:
+            return None, None
+
+
+if __name__ == '__main__':
+    # 吞吐量测试：用合成的包流驱动Decoder，输出字节/秒
+    import json
+    import os
+    import crcmod.predefined
 
+    crc = crcmod.predefined.mkCrcFun('crc-ccitt-false')
 
+    def build_stream(config_array, frame_count, noise_rate=0., seed=0):
+        rng = np.random.default_rng(seed)
+        row_count = config_array['row_array'].__len__()
+        payload_size = config_array['column_array'].__len__() * config_array.get('bytes_per_point', 2)
+        packages = []
+        for frame_number in range(frame_count):
+            for package_number in range(row_count):
+                head = bytes([0xaa, 0x10, 0x33, 0x00, frame_number % 256, package_number])
+                package = head + rng.integers(0, 256, payload_size, dtype=np.uint8).tobytes()
+                package += crc(package).to_bytes(CRC_LENGTH, 'big')
+                if rng.random() < noise_rate:
+                    # 失步：在包前插入杂字节
+                    package = rng.integers(0, 256, rng.integers(1, 32), dtype=np.uint8).tobytes() + package
+                packages.append(package)
+        return b''.join(packages)
 
+    config_array = json.load(open(os.path.join(os.path.dirname(__file__), '../config_files/config_array_64.json'), 'rt'))
+    # 批量CRC与crcmod的结果应一致
+    validator = CrcValidator(HEAD_LENGTH + 64 * 2)
+    samples = np.random.default_rng(0).integers(0, 256, (100, HEAD_LENGTH + 64 * 2), dtype=np.uint8)
+    assert [crc(_.tobytes()) for _ in samples] == validator.calculate(samples).tolist()
+    for noise_rate, message_size in [(0., 1024), (0.1, 1024), (0., 16384), (0.1, 16384), (0.5, 16384)]:
+        stream = build_stream(config_array, 200, noise_rate)
+        decoder = Decoder(dict(config_array, decimation={'mode': 'pass_all'}))
+        frame_count = 0
+        frame_times = []
+        time_begin = time.perf_counter()
+        stream_view = memoryview(stream)
+        for begin in range(0, stream.__len__(), message_size):
+            decoder(stream_view[begin:begin + message_size])
+            while True:
+                data, t = decoder.get()
+                if data is None:
+                    break
+                frame_count += 1
+                frame_times.append(t)
+        time_delta = time.perf_counter() - time_begin
+        # 帧时间单调，无失步时帧号逐一递增
+        assert all(t_1.ns >= t_0.ns for t_0, t_1 in zip(frame_times, frame_times[1:]))
+        if noise_rate == 0:
+            assert [t.frame_number for t in frame_times] == list(range(frame_times.__len__()))
+        print(f'噪声比例{noise_rate}, 单次读取{message_size}字节: {stream.__len__() / time_delta / 1e6:.2f} MB/s, '
+              f'{frame_count / time_delta:.1f} 帧/s, 共{frame_count}帧')
@@ -0,0 +1,321 @@
+# 在子进程中运行传感器驱动（后端、解码、trans），帧经共享内存环形缓冲区传回
+# 界面进程中的代理驱动与原驱动接口相同，DataHandler无需改动：
+# DataHandler(get_process_driver_class(LargeUsbSensorDriver))
+# 被代理的驱动类须可在模块顶层import（子进程以spawn方式启动时需pickle），且get_frame返回np.ndarray帧
+
+import time
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backends.abstract_sensor_driver import SensorDriver
+from backends.decoding import FrameTime, EPOCH_OFFSET
+from backends.acquisition_stats import AcquisitionStats
+
+CONNECT_TIMEOUT = 10.  # 等待子进程连接硬件的时间(s)
+IDLE_SLEEP = 0.001  # 子进程无新帧时的等待(s)
+
+
+class SharedFrameRing:
+    # 共享内存中的定长帧环。单写多读，写者不等待读者，读者落后超过length帧时丢弃最早的帧
+    # 布局：写入总数(int64) | 各槽的帧序号(int64 * length) | 采集时刻的perf_counter_ns(int64 * length)
+    #       | 包头帧号(int64 * length) | 数据
+    # 写入某槽前先将其序号置-1，写完再写入序号，读者读后核对序号，即可发现被覆盖的帧
+
+    def __init__(self, shape, dtype, length, name=None):
+        """
+        :param name: 为None时新建共享内存，否则连接到已有的
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.length = length
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        size = 8 + 24 * length + frame_bytes * length
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        buf = self.shm.buf
+        self.write_count = np.ndarray((1, ), dtype=np.int64, buffer=buf, offset=0)
+        self.sequences = np.ndarray((length, ), dtype=np.int64, buffer=buf, offset=8)
+        self.capture_ns = np.ndarray((length, ), dtype=np.int64, buffer=buf, offset=8 + 8 * length)
+        self.frame_numbers = np.ndarray((length, ), dtype=np.int64, buffer=buf, offset=8 + 16 * length)
+        self.frames = np.ndarray((length, ) + self.shape, dtype=self.dtype, buffer=buf, offset=8 + 24 * length)
+        if self.owner:
+            self.write_count[0] = 0
+            self.sequences[:] = -1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, data, t):
+        """
+        :param t: FrameTime。为普通float时按time.time()的值换算，帧号记为-1
+        """
+        seq = int(self.write_count[0])
+        idx = seq % self.length
+        self.sequences[idx] = -1
+        self.frames[idx] = data
+        self.capture_ns[idx] = getattr(t, 'ns', int((t - EPOCH_OFFSET) * 1e9))
+        self.frame_numbers[idx] = getattr(t, 'frame_number', -1)
+        self.sequences[idx] = seq
+        self.write_count[0] = seq + 1
+
+    def is_valid(self, seq):
+        # 该序号的帧是否仍在环中且未被覆盖
+        return self.sequences[seq % self.length] == seq
+
+    def close(self):
+        # 先释放指向共享内存的数组，否则无法关闭
+        self.write_count = self.sequences = self.capture_ns = self.frame_numbers = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedFrame:
+    # 环中一帧的视图，不复制数据。接口与backends.decoding.PooledFrame相同
+    # 写者不等待读者，读者应尽快用完；如需保留，先detach
+
+    def __init__(self, ring, seq):
+        self.ring = ring
+        self.seq = seq
+        idx = seq % ring.length
+        self.data = ring.frames[idx]
+        self.t = FrameTime(int(ring.capture_ns[idx]), int(ring.frame_numbers[idx]))
+
+    @property
+    def valid(self):
+        # 数据是否仍未被覆盖。使用后检查，为False时本次读到的数据可能不完整
+        return self.ring.is_valid(self.seq)
+
+    def retain(self):
+        return self
+
+    def release(self):
+        pass
+
+    def detach(self):
+        return self.data.copy()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def run_acquisition(driver_class, port, ring_name, shape, dtype, length, stop_event, result_queue, err_queue):
+    """
+    子进程入口：连接硬件，把驱动产生的帧逐一写入环
+    :param result_queue: 回报connect的结果，或其抛出的异常
+    :param err_queue: 转发采集中的异常，由代理驱动在get时抛出
+    """
+    ring = SharedFrameRing(shape, dtype, length, ring_name)
+    driver = driver_class()
+    try:
+        result_queue.put(driver.connect(port))
+    except Exception as e:
+        result_queue.put(e)
+        ring.close()
+        return
+    try:
+        while not stop_event.is_set():
+            try:
+                frame = driver.get_frame()
+            except Exception as e:
+                err_queue.put(e)
+                time.sleep(IDLE_SLEEP)
+                continue
+            if frame is None:
+                time.sleep(IDLE_SLEEP)
+            else:
+                with frame:
+                    ring.write(frame.data, frame.t)
+    finally:
+        driver.disconnect()
+        ring.close()
+
+
+def get_process_driver_class(base_driver_class, ring_length=64, frame_dtype=np.int16):
+
+    class ProcessSensorDriver(SensorDriver):
+
+        SENSOR_SHAPE = base_driver_class.SENSOR_SHAPE
+        DATA_TYPE = base_driver_class.DATA_TYPE
+        SCALE = base_driver_class.SCALE
+        VALUE_DTYPE = base_driver_class.VALUE_DTYPE
+
+        def __init__(self):
+            super().__init__()
+            self.ring = None
+            self.process = None
+            self.stop_event = None
+            self.err_queue = None
+            self.read_count = 0  # 下一个要读的帧序号
+            self.acquisition_stats = AcquisitionStats()
+            self.acquisition_stats.add_gauge('ring_occupancy', self.__occupancy)
+            self.acquisition_stats.add_gauge('ring_length', lambda: ring_length)
+
+        @property
+        def connected(self):
+            return self.process is not None and self.process.is_alive()
+
+        @property
+        def stats(self):
+            # 界面进程一侧的统计：frames_output为读出的帧数，frames_evicted为读者落后时被覆盖的帧数
+            return self.acquisition_stats
+
+        def __occupancy(self):
+            if self.ring is None:
+                return 0
+            return int(self.ring.write_count[0]) - self.read_count
+
+        def connect(self, port):
+            if self.connected:
+                return True
+            self.ring = SharedFrameRing(self.SENSOR_SHAPE, frame_dtype, ring_length)
+            self.read_count = 0
+            self.stop_event = multiprocessing.Event()
+            self.err_queue = multiprocessing.Queue()
+            result_queue = multiprocessing.Queue()
+            self.process = multiprocessing.Process(
+                target=run_acquisition,
+                args=(base_driver_class, port, self.ring.name, self.SENSOR_SHAPE, frame_dtype, ring_length,
+                      self.stop_event, result_queue, self.err_queue),
+                daemon=True)
+            self.process.start()
+            result = TimeoutError("子进程连接超时")
+            time_begin = time.time()
+            while time.time() - time_begin < CONNECT_TIMEOUT:
+                try:
+                    result = result_queue.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    if not self.process.is_alive():
+                        result = RuntimeError("子进程意外退出")
+                        break
+            if isinstance(result, Exception) or not result:
+                self.disconnect()
+                if isinstance(result, Exception):
+                    raise result
+                return False
+            return True
+
+        def disconnect(self):
+            if self.process is not None:
+                self.stop_event.set()
+                self.process.join(CONNECT_TIMEOUT)
+                if self.process.is_alive():
+                    self.process.terminate()
+                self.process = None
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+            return True
+
+        def __check_error(self):
+            if self.err_queue is not None:
+                try:
+                    raise self.err_queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+        def get_frame(self):
+            self.__check_error()
+            if self.ring is None:
+                return None
+            write_count = int(self.ring.write_count[0])
+            if self.read_count >= write_count:
+                return None
+            # 留一个槽的余量，避免读到正在写入的槽
+            oldest = write_count - ring_length + 1
+            if self.read_count < oldest:
+                self.acquisition_stats.count('frames_evicted', oldest - self.read_count)
+                self.read_count = oldest
+            frame = SharedFrame(self.ring, self.read_count)
+            self.read_count += 1
+            self.acquisition_stats.count('frames_output')
+            return frame
+
+        def get_last_frame(self):
+            self.__check_error()
+            if self.ring is None:
+                return None
+            write_count = int(self.ring.write_count[0])
+            if self.read_count >= write_count:
+                return None
+            self.read_count = write_count - 1
+            return self.get_frame()
+
+        def get_batch(self, max_count=None):
+            # 直接从环中成段复制，再剔除复制期间被覆盖的帧
+            self.__check_error()
+            if self.ring is None:
+                return None, None
+            write_count = int(self.ring.write_count[0])
+            oldest = write_count - ring_length + 1
+            if self.read_count < oldest:
+                self.acquisition_stats.count('frames_evicted', oldest - self.read_count)
+                self.read_count = oldest
+            end = write_count if max_count is None else min(write_count, self.read_count + max_count)
+            if self.read_count >= end:
+                return None, None
+            sequences = np.arange(self.read_count, end)
+            indices = sequences % ring_length
+            data = self.ring.frames[indices]
+            capture_ns = self.ring.capture_ns[indices]
+            frame_numbers = self.ring.frame_numbers[indices]
+            valid = self.ring.sequences[indices] == sequences
+            self.read_count = end
+            self.acquisition_stats.count('frames_output', int(valid.sum()))
+            self.acquisition_stats.count('frames_evicted', int(valid.__len__() - valid.sum()))
+            if not valid.any():
+                return None, None
+            t = [FrameTime(ns, frame_number) for ns, frame_number
+                 in zip(capture_ns[valid].tolist(), frame_numbers[valid].tolist())]
+            return data[valid], t
+
+        def __get_copy(self, get_frame):
+            while True:
+                frame = get_frame()
+                if frame is None:
+                    return None, None
+                data = frame.detach()
+                if frame.valid:
+                    return data, frame.t
+                # 复制期间被写者覆盖，丢弃并重取
+                self.acquisition_stats.count('frames_evicted')
+
+        def get(self):
+            return self.__get_copy(self.get_frame)
+
+        def get_last(self):
+            return self.__get_copy(self.get_last_frame)
+
+        def __del__(self):
+            try:
+                self.disconnect()
+            except Exception:
+                pass
+
+    return ProcessSensorDriver
+
+
+if __name__ == '__main__':
+    from backends.usb_driver import LargeUsbSensorDriver
+    driver = get_process_driver_class(LargeUsbSensorDriver)()
+    driver.connect(0)
+    while True:
+        data, t = driver.get()
+        if data is not None:
+            print(data)
+            print(t)
+            print(driver.stats)
+        else:
+            time.sleep(0.001)
@@ -11,15 +11,18 @@ import json
 baud_rate = json.load(open(os.path.join(os.path.dirname(__file__), '../config_files/config_serial.json'), 'rt'))['baud_rate']
 print(f"Baud rate: {baud_rate}")
 
+READ_TIMEOUT = 0.01  # 无数据时单次读取最多等待的时间
+
 
 class SerialBackend:
     def __init__(self, config_array):
-        self.serial = serial.Serial(None, baud_rate, timeout=None)
+        self.serial = serial.Serial(None, baud_rate, timeout=READ_TIMEOUT)
         # 解包
         self.decoder = Decoder(config_array)
         self.err_queue = deque(maxlen=1)
         #
         self.active = False
+        self.stats = self.decoder.stats
 
     def start(self, port):
         # 通过REV号区分不同的采集卡
@@ -43,13 +46,21 @@ class SerialBackend:
 
     def read(self):
         try:
-            last_message = [int(_) for _ in self.serial.read()]
+            # 一次取走串口缓冲中的所有字节；缓冲为空时等待首个字节，最多READ_TIMEOUT
+            last_message = self.serial.read(max(self.serial.in_waiting, 1))
+            capture_ns = time.perf_counter_ns()
         except Exception as e:
             self.stop()
             self.err_queue.append(e)
             print(e)
             raise Exception('Serial read/write failed')
-        self.decoder(last_message)
+        if last_message:
+            self.decoder(last_message, capture_ns)
+
+    @property
+    def throughput(self):
+        # 最近一个统计窗口内的字节/秒
+        return self.stats.snapshot()['bytes_per_second']
 
     def get(self):
         return self.decoder.get()
@@ -57,6 +68,12 @@ class SerialBackend:
     def get_last(self):
         return self.decoder.get_last()
 
+    def get_frame(self):
+        return self.decoder.get_frame()
+
+    def get_last_frame(self):
+        return self.decoder.get_last_frame()
+
 
 if __name__ == '__main__':
     # 简单的调用测试
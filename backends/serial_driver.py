@@ -2,6 +2,7 @@ from backends.abstract_sensor_driver import SensorDriver
 import json
 from backends.serial_backend import SerialBackend
 import os
+import re
 
 
 class SerialSensorDriver(SensorDriver):
@@ -18,11 +19,14 @@ class SerialSensorDriver(SensorDriver):
     def connected(self):
         return self.sensor_backend.active
 
+    @property
+    def stats(self):
+        return self.sensor_backend.stats
+
     def connect(self, port):
-        try:
-            port = str(port)
-            assert port.startswith("COM")
-        except ValueError:
+        port = str(port)
+        # Windows下形如COM3，Linux/macOS下形如/dev/ttyUSB0
+        if not (re.fullmatch(r'COM\d+', port, flags=re.IGNORECASE) or port.startswith('/dev/')):
             raise ValueError("错误的设备号格式")
         return self.sensor_backend.start(port)
 
@@ -41,6 +45,16 @@ class SerialSensorDriver(SensorDriver):
         data, t = self.sensor_backend.get_last()
         return data, t
 
+    def get_frame(self):
+        if self.sensor_backend.err_queue:
+            raise self.sensor_backend.err_queue.popleft()
+        return self.sensor_backend.get_frame()
+
+    def get_last_frame(self):
+        if self.sensor_backend.err_queue:
+            raise self.sensor_backend.err_queue.popleft()
+        return self.sensor_backend.get_last_frame()
+
 
 class Serial16SensorDriver(SerialSensorDriver):
 
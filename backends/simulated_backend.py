@@ -0,0 +1,218 @@
+# 模拟的采集卡：按真实的线上格式（包头、帧号、包号、按row_array/column_array排布的载荷、CRC）生成字节流
+# 经完整的Decoder解码，可在没有硬件时对整条采集链路做压力测试
+# 在config_array中加入"simulation"即可让UsbSensorDriver/CanSensorDriver改用本后端，如：
+# "simulation": {"fps": 2000, "jitter": 0.0001, "loss_rate": 0.0001, "corruption_rate": 0.0001}
+
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+from backends.decoding import Decoder, CrcValidator, HEAD_LENGTH, CRC_LENGTH, build_frame_plan
+
+HEADER = (0xaa, 0x10, 0x33, 0x00)
+CHUNK_SIZE = 1024  # 每次送入解码器的字节数，与UsbBackend的MESSAGE_SIZE一致
+MAX_BATCH = 64  # 落后于预定时间时，一次最多补发的帧数
+
+
+class PacketGenerator:
+    # 把传感器空间的帧编码为采集卡发出的包流
+
+    def __init__(self, config_array, seed=0):
+        row_array = config_array['row_array']
+        column_array = config_array['column_array']
+        self.bytes_per_point = config_array.get('bytes_per_point', 2)
+        self.sensor_shape = (row_array.__len__(), column_array.__len__())
+        self.package_size = HEAD_LENGTH + CRC_LENGTH + self.sensor_shape[1] * self.bytes_per_point
+        self.frame_plan = build_frame_plan(row_array, column_array, config_array.get('extra_swap', []))
+        self.raw_dtype = np.dtype('>i2') if self.bytes_per_point == 2 else np.dtype(np.int8)
+        self.raw_values = np.zeros((self.frame_plan.__len__() + 1, ), dtype=self.raw_dtype)
+        self.crc_validator = CrcValidator(self.package_size - CRC_LENGTH)
+        # 一帧的全部包。包头和包号固定，每帧只改写帧号、载荷和CRC
+        self.packages = np.zeros((self.sensor_shape[0], self.package_size), dtype=np.uint8)
+        self.packages[:, :4] = HEADER
+        self.packages[:, 5] = np.arange(self.sensor_shape[0])
+        self.frame_number = 0
+        self.rng = np.random.default_rng(seed)
+        # 合成图案用的坐标
+        self.grid = np.mgrid[0:self.sensor_shape[0], 0:self.sensor_shape[1]].astype(float)
+        self.amplitude = 2000. if self.bytes_per_point == 2 else 100.
+
+    def make_frame(self, t):
+        """
+        合成一帧：沿圆周移动的高斯形压痕
+        :param t: 时间(s)
+        :return: int16数组
+        """
+        center = np.array(self.sensor_shape, dtype=float) / 2.
+        radius = center.min() / 2.
+        center = center + radius * np.array([np.cos(t), np.sin(t)])
+        sigma = max(center.min() / 4., 1.)
+        distance_2 = ((self.grid - center[:, None, None]) ** 2).sum(axis=0)
+        return np.rint(self.amplitude * np.exp(-distance_2 / (2 * sigma ** 2))).astype(np.int16)
+
+    def encode(self, frame):
+        """
+        编码一帧，帧号自动递增
+        :param frame: 传感器空间的帧
+        :return: uint8数组，为内部缓存的视图，下次调用前有效
+        """
+        self.raw_values[self.frame_plan] = frame.reshape(-1)
+        self.packages[:, HEAD_LENGTH:self.package_size - CRC_LENGTH] \
+            = self.raw_values[:-1].view(np.uint8).reshape(self.sensor_shape[0], -1)
+        self.packages[:, 4] = self.frame_number
+        self.frame_number = (self.frame_number + 1) % 256
+        crc = self.crc_validator.calculate(self.packages[:, :self.package_size - CRC_LENGTH])
+        self.packages[:, -2] = crc >> 8
+        self.packages[:, -1] = crc & 0xff
+        return self.packages.reshape(-1)
+
+    def corrupt(self, stream, loss_rate=0., corruption_rate=0.):
+        """
+        模拟传输错误
+        :param loss_rate: 每个字节丢失的概率
+        :param corruption_rate: 每个字节被替换为随机值的概率
+        :return: 新的uint8数组
+        """
+        # 只对出错的位置抽样，开销与出错的字节数成正比
+        if loss_rate > 0:
+            lost = self.rng.integers(0, stream.__len__(), self.rng.binomial(stream.__len__(), loss_rate))
+            stream = np.delete(stream, lost)
+        else:
+            stream = stream.copy()
+        if corruption_rate > 0:
+            corrupted = self.rng.integers(0, stream.__len__(), self.rng.binomial(stream.__len__(), corruption_rate))
+            stream[corrupted] = self.rng.integers(0, 256, corrupted.__len__(), dtype=np.uint8)
+        return stream
+
+    def generate(self, frame_count, loss_rate=0., corruption_rate=0.):
+        """
+        连续生成若干帧的包流，图案按100帧/s的时间推进
+        :return: (uint8数组, 原始帧的列表)
+        """
+        frames = [self.make_frame(idx * 0.01) for idx in range(frame_count)]
+        stream = np.concatenate([self.encode(frame).copy() for frame in frames])
+        return self.corrupt(stream, loss_rate, corruption_rate), frames
+
+
+class SimulatedBackend:
+    # 与UsbBackend、CanBackend接口相同。在子线程中按设定帧率发出包流并解码
+    # 预先编码一个周期（帧号0~255）的包流，运行时只需切片，生成开销可忽略
+
+    def __init__(self, config_array):
+        simulation = config_array.get('simulation', {})
+        self.fps = simulation.get('fps', 1000.)  # 不大于0时不限速，尽快生成
+        self.jitter = simulation.get('jitter', 0.)  # 帧间隔的标准差(s)
+        self.loss_rate = simulation.get('loss_rate', 0.)
+        self.corruption_rate = simulation.get('corruption_rate', 0.)
+        self.chunk_size = simulation.get('chunk_size', CHUNK_SIZE)
+        self.generator = PacketGenerator(config_array, simulation.get('seed', 0))
+        self.cycle = np.stack([self.generator.encode(self.generator.make_frame(2 * np.pi * idx / 256.)).copy()
+                               for idx in range(256)])
+        self.frame_index = 0
+        # 解包
+        self.decoder = Decoder(config_array)
+        self.err_queue = deque(maxlen=1)
+        self.stats = self.decoder.stats
+        #
+        self.active = False
+
+    def get_available_sources(self):
+        return [0]
+
+    def start(self, port):
+        if not self.active:
+            self.active = True
+            threading.Thread(target=self.__generate_forever, daemon=True).start()
+        return True
+
+    def stop(self):
+        self.active = False
+        return True
+
+    def query_dna(self):
+        return None
+
+    def __next_interval(self):
+        if self.fps <= 0:
+            return 0.
+        return max(1. / self.fps + self.jitter * self.generator.rng.standard_normal(), 0.)
+
+    def __generate_forever(self):
+        time_next = time.perf_counter()
+        while self.active:
+            time_now = time.perf_counter()
+            if time_now < time_next:
+                time.sleep(time_next - time_now)
+                continue
+            # 补齐所有已到期的帧，一并送入解码器
+            frame_count = 0
+            while time_next <= time_now and frame_count < MAX_BATCH:
+                frame_count += 1
+                time_next += self.__next_interval()
+            if time_next < time_now - 1.:
+                # 生成跟不上设定帧率，不再追赶
+                time_next = time_now
+            indices = np.arange(self.frame_index, self.frame_index + frame_count) % self.cycle.__len__()
+            self.frame_index = (self.frame_index + frame_count) % self.cycle.__len__()
+            stream = self.generator.corrupt(self.cycle[indices].reshape(-1), self.loss_rate, self.corruption_rate)
+            capture_ns = time.perf_counter_ns()
+            for begin in range(0, stream.__len__(), self.chunk_size):
+                self.decoder(stream[begin:begin + self.chunk_size], capture_ns)
+
+    def get(self):
+        return self.decoder.get()
+
+    def get_last(self):
+        return self.decoder.get_last()
+
+    def get_frame(self):
+        return self.decoder.get_frame()
+
+    def get_last_frame(self):
+        return self.decoder.get_last_frame()
+
+
+if __name__ == '__main__':
+    # 1. 各配置下，生成的包流应能被Decoder原样解出
+    # 2. 经UsbSensorDriver的完整链路在不同设定帧率下的实际帧率
+    import glob
+    import json
+    import os
+    from backends.usb_driver import UsbSensorDriver
+
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), '../config_files/config_array_*.json'))):
+        config_array = json.load(open(path, 'rt'))
+        config_array['decimation'] = {'mode': 'pass_all'}
+        generator = PacketGenerator(config_array)
+        stream, frames = generator.generate(32)
+        decoder = Decoder(config_array)
+        decoder(stream)
+        decoded = []
+        while True:
+            data, t = decoder.get()
+            if data is None:
+                break
+            decoded.append(data)
+        # 最后一帧要等下一帧开始才确认完成；缓存较短时，较早的帧会被挤出
+        assert decoded.__len__() == min(frames.__len__() - 1, decoder.buffer_length)
+        frames = frames[frames.__len__() - 1 - decoded.__len__():-1]
+        # 没有包写入的点位解出为0，不参与比较
+        covered = generator.frame_plan < generator.frame_plan.__len__()
+        for data, frame in zip(decoded, frames):
+            assert np.array_equal(data.reshape(-1)[covered], frame.reshape(-1)[covered].astype(data.dtype))
+        print(f'{os.path.basename(path)}: 编解码一致')
+
+    config_array = json.load(open(os.path.join(os.path.dirname(__file__), '../config_files/config_array_64.json'), 'rt'))
+    for fps, chunk_size in [(100, 1024), (1000, 1024), (5000, 1024), (5000, 16384), (0, 16384)]:
+        config_array['decimation'] = {'mode': 'pass_all'}
+        config_array['simulation'] = {'fps': fps, 'jitter': 0.00005, 'loss_rate': 1e-7, 'corruption_rate': 1e-7,
+                                      'chunk_size': chunk_size}
+        driver = UsbSensorDriver((64, 64), config_array)
+        driver.connect(0)
+        time.sleep(2.)
+        driver.disconnect()
+        snapshot = driver.stats.snapshot()
+        print(f'设定{fps}帧/s, 单次{chunk_size}字节: 实际{snapshot["fps"]:.1f}帧/s, 被拒绝的包{snapshot["packages_rejected"]}, '
+              f'缓存挤出{snapshot["frames_evicted"]}')
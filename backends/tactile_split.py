@@ -1,5 +1,3 @@
-import copy
-
 # disable any warnings
 import warnings
 warnings.filterwarnings("ignore")
@@ -11,16 +9,155 @@ MIN_LEN = 32
 DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
 
+class RegionLayout:
+    # 各分片在full_data上的收集索引，翻转、转置都已合并在内
+    # 分片按range_mapping的键序排列，较小的分片补零到相同的(h, w)，整体为(分片数, h, w)
+
+    def __init__(self, range_mapping, shape):
+        self.keys = list(range_mapping.keys())
+        self.key_index = {k: i for i, k in enumerate(self.keys)}
+        sentinel = int(np.prod(shape))  # 补零位置的索引，指向full_data之后追加的0
+        flat = np.arange(sentinel).reshape(shape)
+        region_indices = []
+        for k in self.keys:
+            slicing, x_invert, y_invert, xy_swap = range_mapping[k][:4]
+            index = flat[slicing]
+            if x_invert:
+                index = index[::-1, :]
+            if y_invert:
+                index = index[:, ::-1]
+            if xy_swap:
+                index = index.T
+            region_indices.append(index)
+        self.region_shapes = [index.shape for index in region_indices]
+        packed_shape = (self.keys.__len__(),
+                        max([_[0] for _ in self.region_shapes], default=0),
+                        max([_[1] for _ in self.region_shapes], default=0))
+        self.gather = np.full(packed_shape, sentinel, dtype=np.intp)
+        for r, index in enumerate(region_indices):
+            self.gather[r, :index.shape[0], :index.shape[1]] = index
+        self.valid = self.gather != sentinel
+        self.scale = np.array([range_mapping[k][4] for k in self.keys], dtype=float)[:, None, None]
+        self.power = np.array([range_mapping[k][5] for k in self.keys], dtype=float)[:, None, None]
+        self.identity = bool(np.all(self.scale == 1) and np.all(self.power == 1))
+        # 按power分组，每组以标量做一次乘方，与逐分片计算的结果一致
+        self.power_groups = [(float(power), np.flatnonzero(self.power.reshape(-1) == power))
+                             for power in np.unique(self.power)]
+        self.extended = None  # full_data展平后追加一个0，供收集
+
+    @staticmethod
+    def work_dtype(dtype):
+        # 数组与Python float运算的结果dtype
+        return np.result_type(dtype, 1.)
+
+    def region_index(self, idx):
+        # 分片各点在展平的full_data中的位置
+        r = self.key_index[idx]
+        h, w = self.region_shapes[r]
+        return self.gather[r, :h, :w]
+
+    def pack(self, full_data):
+        """
+        一次收集所有分片，并截负、施加power和scale
+        :return: (分片数, h, w)，dtype与full_data相同
+        """
+        size = full_data.size
+        if self.extended is None or self.extended.dtype != full_data.dtype or self.extended.size != size + 1:
+            self.extended = np.zeros((size + 1, ), dtype=full_data.dtype)
+        self.extended[:-1] = full_data.reshape(-1)
+        packed = np.take(self.extended, self.gather)
+        np.maximum(packed, 0, out=packed)
+        if not self.identity:
+            # 与逐分片计算x ** power * scale（power、scale为Python float）的dtype相同：浮点数据保持其dtype，整型为float64
+            work_dtype = self.work_dtype(full_data.dtype)
+            powered = np.empty(packed.shape, dtype=work_dtype)
+            for power, regions in self.power_groups:
+                powered[regions] = packed[regions].astype(work_dtype, copy=False) ** power
+            packed = (powered * self.scale.astype(work_dtype)).astype(full_data.dtype)
+            packed[~self.valid] = 0
+        return packed
+
+    def unpack(self, packed, full_data):
+        """
+        pack的逆过程，把各分片写回full_data。分片重叠时，靠后的分片生效
+        """
+        values = packed
+        if not self.identity:
+            work_dtype = self.work_dtype(packed.dtype)
+            values = (packed.astype(work_dtype, copy=False) ** (self.power ** -1).astype(work_dtype)) \
+                / self.scale.astype(work_dtype)
+        np.put(full_data, self.gather[self.valid], values[self.valid])
+
+
+REGION_LAYOUT_CACHE = {}
+
+
+def get_region_layout(range_mapping, shape):
+    # range_mapping通常是驱动类的类属性，按其id缓存。同时持有range_mapping，避免id被复用
+    key = (id(range_mapping), tuple(shape))
+    if key not in REGION_LAYOUT_CACHE:
+        REGION_LAYOUT_CACHE[key] = (range_mapping, RegionLayout(range_mapping, shape))
+    return REGION_LAYOUT_CACHE[key][1]
+
+
 class SplitDataDict:
     # dict-like的数据结构。其内核仍是整片的64*64数据，但在读取时会即时处理
     # 注意，使用apply_filter_for_each对各分片应用滤波器时，处理机制会较为特殊
+    # 各分片在首次读取时计算并缓存，full_data被写入后失效。因此每帧每个分片至多计算一次
+    # 读出的分片是只读的；power与scale都为1时，它是截负后的整片数据上的视图，不复制
+    # copy()为写时复制：副本与原对象共享只读的full_data及已算出的分片，任一方写入full_data前才各自复制
 
     def __init__(self, full_data, range_mapping: dict):
+        self.region_cache = {}
+        self.clipped = None  # 截负后的整片数据，供视图分片共用
+        self.packed_cache = None
         self.full_data = np.zeros(shape=full_data.shape, dtype=full_data.dtype)
         self.full_data[...] = full_data.__array__()  # 全阵列
         self.range_mapping = range_mapping
         self.unit_filter_objs = []
 
+    @property
+    def full_data(self):
+        return self.__full_data
+
+    @full_data.setter
+    def full_data(self, full_data):
+        self.__full_data = full_data
+        self.invalidate()
+
+    def __own(self):
+        # 写入full_data前调用。与其他对象共享（只读）时，先复制出自己的一份
+        if not self.__full_data.flags.writeable:
+            self.__full_data = self.__full_data.copy()
+
+    def invalidate(self):
+        """
+        丢弃缓存的分片。经本类的方法写入full_data时会自动调用；在外部原地修改full_data后须手动调用
+        """
+        self.region_cache.clear()
+        self.clipped = None
+        self.packed_cache = None
+
+    @property
+    def layout(self) -> RegionLayout:
+        return get_region_layout(self.range_mapping, self.full_data.shape)
+
+    @property
+    def packed(self):
+        """
+        所有分片排成的(分片数, h, w)只读数组，顺序同keys()，较小的分片补0。不含apply_filter_for_each的滤波
+        分片滤波、特征提取等可对它一次批量计算，结果经set_packed写回
+        """
+        if self.packed_cache is None:
+            self.packed_cache = self.layout.pack(self.full_data)
+            self.packed_cache.flags.writeable = False
+        return self.packed_cache
+
+    def set_packed(self, packed):
+        self.__own()
+        self.layout.unpack(np.asarray(packed), self.full_data)
+        self.invalidate()
+
     @property
     def dtype(self):
         return self.full_data.dtype
@@ -72,12 +209,19 @@ class SplitDataDict:
         return self.__array_wrap__(np.abs(self.full_data))
 
     def apply_filter(self, filter_obj: callable, **kwargs):
-        self.full_data[...] = filter_obj(self.full_data, **kwargs)
+        filtered = filter_obj(self.full_data, **kwargs)
+        self.__own()
+        self.full_data[...] = filtered
+        self.invalidate()
 
     def apply_filter_for_each(self, filters_obj: dict, **kwargs):
-        self.unit_filter_objs.append(filters_obj, **kwargs)
+        # 列表可能与副本共享，不原地追加
+        self.unit_filter_objs = self.unit_filter_objs + [filters_obj]
+        self.invalidate()
 
     def __getitem__(self, idx):
+        if idx in self.region_cache:
+            return self.region_cache[idx]
         if idx in self.range_mapping.keys():
             info = self.range_mapping[idx]
             slicing = info[0]
@@ -86,17 +230,27 @@ class SplitDataDict:
             xy_swap = info[3]
             scale = info[4]
             power = info[5]
-            data_this = (((np.maximum(self.full_data[slicing], 0.)) ** power) * scale).astype(self.full_data.dtype)
-
-            if x_invert:
-                data_this = data_this[::-1, :]
-            if y_invert:
-                data_this = data_this[:, ::-1]
-            if xy_swap:
-                data_this = data_this.T
+            if power == 1 and scale == 1:
+                if self.clipped is None:
+                    self.clipped = np.maximum(self.full_data, 0).astype(self.full_data.dtype, copy=False)
+                data_this = self.clipped[slicing]
+                if x_invert:
+                    data_this = data_this[::-1, :]
+                if y_invert:
+                    data_this = data_this[:, ::-1]
+                if xy_swap:
+                    data_this = data_this.T
+            else:
+                # 从一次算出的所有分片中取出，翻转、转置已合并在收集索引中
+                r = self.layout.key_index[idx]
+                h, w = self.layout.region_shapes[r]
+                data_this = self.packed[r, :h, :w]
 
             for filter_obj in self.unit_filter_objs:
                 data_this = filter_obj[idx](data_this)
+            data_this = data_this.view()
+            data_this.flags.writeable = False
+            self.region_cache[idx] = data_this
             return data_this
         else:
             raise KeyError(str(idx))
@@ -104,22 +258,16 @@ class SplitDataDict:
     def __setitem__(self, idx, data_this):
         if idx in self.range_mapping.keys():
             info = self.range_mapping[idx]
-            slicing = info[0]
-            x_invert = info[1]
-            y_invert = info[2]
-            xy_swap = info[3]
             scale = info[4]
             power = info[5]
-
-            if xy_swap:
-                data_this = data_this.T
-            if x_invert:
-                data_this = data_this[::-1, :]
-            if y_invert:
-                data_this = data_this[:, ::-1]
-
-            self.full_data[slicing] = (data_this ** (power ** -1)) / scale
-
+            # 分片索引已含翻转、转置，直接写回
+            index = self.layout.region_index(idx)
+            values = (np.asarray(data_this) ** (power ** -1)) / scale
+            # 与按切片赋值相同：可广播的值广播到分片形状，形状不符时抛出ValueError，而不是被np.put重复或截断
+            values = np.broadcast_to(values, index.shape)
+            self.__own()
+            np.put(self.full_data, index, values)
+            self.invalidate()
         else:
             raise KeyError(str(idx))
 
@@ -135,8 +283,20 @@ class SplitDataDict:
             yield k, self[k]
 
     def copy(self):
-        ret = SplitDataDict(copy.deepcopy(self.full_data), self.range_mapping)
-        ret.unit_filter_objs = copy.deepcopy(self.unit_filter_objs)
+        """
+        写时复制的副本。range_mapping与分片滤波器（unit_filter_objs中的对象）总是共享的
+        """
+        if self.__full_data.flags.writeable:
+            shared = self.__full_data.view()
+            shared.flags.writeable = False
+            self.__full_data = shared
+        ret = SplitDataDict.__new__(SplitDataDict)
+        ret.__full_data = self.__full_data
+        ret.range_mapping = self.range_mapping
+        ret.unit_filter_objs = self.unit_filter_objs
+        ret.region_cache = dict(self.region_cache)
+        ret.clipped = self.clipped
+        ret.packed_cache = self.packed_cache
         return ret
 
     def __bool__(self):
@@ -202,20 +362,47 @@ def get_split_driver_class(base_driver_class, config_mapping):
             return super().disconnect()
 
         def get(self):
-            data_fingers, t_last = None, None
-            while True:
-                data, t = super().get()
-                if data is not None:
-                    data_fingers = SplitDataDict(data, self.range_mapping)
-                    t_last = t
-                else:
-                    break
-            # 总是只返回最新的，但所有数据都必须过一遍预处理器
-            return data_fingers, t_last
+            # 只取最新的一帧包装为SplitDataDict，其余帧直接归还帧池。需要逐帧处理全部数据时，使用get_batch
+            frame = super().get_last_frame()
+            if frame is None:
+                return None, None
+            with frame:
+                return SplitDataDict(frame.data, self.range_mapping), frame.t
 
     return TactileDriverWithPreprocessing
 
 if __name__ == '__main__':
+    # 各分片与逐分片计算((max(x, 0) ** power) * scale).astype(dtype)逐位一致，包括float32与非1的scale、power
+    range_mapping = {0: [(slice(0, 32), slice(0, 40)), False, False, False, 1., 1.],
+                     1: [(slice(32, 64), slice(0, 40)), True, False, True, 0.37, 1.3],
+                     2: [(slice(0, 20), slice(40, 64)), False, True, False, 2.5, 0.7],
+                     3: [(slice(20, 64), slice(40, 64)), True, True, False, 3.1, 1.3]}
+    rng = np.random.default_rng(0)
+    for full_data in [(rng.random((64, 64)) * 3000 - 200).astype(np.float32), rng.random((64, 64)) * 3000 - 200,
+                      rng.integers(-200, 3000, (64, 64)).astype(np.int16)]:
+        split_data_dict = SplitDataDict(full_data, range_mapping)
+        for k, (slicing, x_invert, y_invert, xy_swap, scale, power) in range_mapping.items():
+            expected = (((np.maximum(full_data[slicing], 0.)) ** power) * scale).astype(full_data.dtype)
+            expected = expected[::-1 if x_invert else 1, ::-1 if y_invert else 1]
+            expected = expected.T if xy_swap else expected
+            assert split_data_dict[k].dtype == full_data.dtype and np.array_equal(split_data_dict[k], expected), \
+                (full_data.dtype, k)
+    print('分片与逐分片计算一致')
+    # 写回分片：形状不符时与按切片赋值一样抛出ValueError
+    split_data_dict = SplitDataDict(np.zeros((64, 64), dtype=np.float32), range_mapping)
+    values = rng.random((40, 32)).astype(np.float32)
+    split_data_dict[1] = values
+    expected = np.zeros((64, 64), dtype=np.float32)
+    expected[32:64, 0:40] = (values.T[::-1, :] ** (1.3 ** -1)) / 0.37
+    assert np.allclose(split_data_dict.full_data, expected)
+    split_data_dict[2] = 0.
+    for wrong in [np.zeros((32, 40)), np.zeros(20 * 24 - 1), np.zeros(20 * 24 * 2)]:
+        try:
+            split_data_dict[2] = wrong
+            raise AssertionError(wrong.shape)
+        except ValueError:
+            pass
+
     # test SplitDataDict
     full_data = np.random.rand(64, 64)
     range_mapping = {
@@ -227,6 +414,7 @@ if __name__ == '__main__':
     split_data_dict = SplitDataDict(full_data, range_mapping)
     print("Full Data Shape:", split_data_dict.shape)
     print("Keys:", list(split_data_dict.keys()))
+    print("Packed Shape:", split_data_dict.packed.shape)
     for key in split_data_dict.keys():
         print(f"Data for key {key}:\n", split_data_dict[key])
     summed = np.sum(split_data_dict)
@@ -235,5 +423,4 @@ if __name__ == '__main__':
     print("Sum of all data:", summed)
     print("Mean of all data:", mean)
     print("Max of all data:", max)
-    pass
 
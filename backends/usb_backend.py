@@ -2,6 +2,7 @@
 
 import usb.core
 import threading
+import queue
 from collections import deque
 import time
 import numpy as np
@@ -24,6 +25,12 @@ class UsbBackend:
         # 解包
         self.decoder = Decoder(config_array)
         self.err_queue = deque(maxlen=1)
+        # 读取方式。usb_queue_depth为0时，在同一线程中逐次读取MESSAGE_SIZE并解码
+        # 否则由专门的读取线程连续发起usb_read_size的读取，读到的数据经深度为usb_queue_depth的队列交给解码线程
+        self.read_size = config_array.get('usb_read_size', MESSAGE_SIZE)
+        self.queue_depth = config_array.get('usb_queue_depth', 0)
+        self.stats = self.decoder.stats
+        self.stats.count('usb_short_reads', 0)  # 读到的字节数少于read_size的次数
         #
         self.active = False
         #
@@ -50,7 +57,7 @@ class UsbBackend:
                 self.epvo_t = epvo_t
                 self.epvi_t = epvi_t
             self.active = True
-            threading.Thread(target=self.__read_forever, daemon=True).start()
+            self.__start_reading()
             return True
         except usb.core.USBError as e:
             print('Failed to connect to USB device')
@@ -68,7 +75,7 @@ class UsbBackend:
                 self.epvo_t = epvo_t
                 self.epvi_t = epvi_t
             self.active = True
-            threading.Thread(target=self.__read_forever, daemon=True).start()
+            self.__start_reading()
             return True
         except usb.core.USBError as e:
             print('Failed to connect to USB device')
@@ -146,19 +153,70 @@ class UsbBackend:
         self.active = False
         return True
 
+    def __start_reading(self):
+        if self.queue_depth > 0:
+            # 预分配的读取缓冲。一个在读取线程，一个在解码线程，其余在队列中
+            # 已读、待解码的至多queue_depth块，再多时丢弃最早的一块，计入chunks_dropped
+            free_buffers = queue.Queue()
+            for _ in range(self.queue_depth + 2):
+                free_buffers.put(array('B', bytes(self.read_size)))
+            filled_buffers = queue.Queue(maxsize=self.queue_depth)
+            threading.Thread(target=self.__read_queued_forever, args=(free_buffers, filled_buffers),
+                             daemon=True).start()
+            threading.Thread(target=self.__decode_queued_forever, args=(free_buffers, filled_buffers),
+                             daemon=True).start()
+        else:
+            threading.Thread(target=self.__read_forever, daemon=True).start()
+
     def __read_forever(self):
         while self.active:
             self.__read()
 
+    def __read_queued_forever(self, free_buffers, filled_buffers):
+        # 读取线程只做USB读取，保证读取请求首尾相接
+        while self.active:
+            buffer = free_buffers.get()
+            try:
+                length = self.epi_t.read(buffer)
+                capture_ns = time.perf_counter_ns()
+            except usb.core.USBError as e:
+                self.stop()
+                self.err_queue.append(e)
+                print(e)
+                raise Exception('USB read/write failed')
+            if length < self.read_size:
+                self.stats.count('usb_short_reads')
+            while True:
+                try:
+                    filled_buffers.put_nowait((buffer, length, capture_ns))
+                    break
+                except queue.Full:
+                    # 解码跟不上。丢弃最早读到的数据，归还其缓冲
+                    try:
+                        free_buffers.put(filled_buffers.get_nowait()[0])
+                        self.stats.count('chunks_dropped')
+                    except queue.Empty:
+                        pass
+
+    def __decode_queued_forever(self, free_buffers, filled_buffers):
+        while self.active:
+            try:
+                buffer, length, capture_ns = filled_buffers.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.decoder(memoryview(buffer)[:length], capture_ns)
+            free_buffers.put(buffer)
+
     def __read(self):
         try:
             last_message = self.epi_t.read(MESSAGE_SIZE)
+            capture_ns = time.perf_counter_ns()
         except usb.core.USBError as e:
             self.stop()
             self.err_queue.append(e)
             print(e)
             raise Exception('USB read/write failed')
-        self.decoder(last_message)
+        self.decoder(last_message, capture_ns)
 
     def get(self):
         return self.decoder.get()
@@ -166,6 +224,12 @@ class UsbBackend:
     def get_last(self):
         return self.decoder.get_last()
 
+    def get_frame(self):
+        return self.decoder.get_frame()
+
+    def get_last_frame(self):
+        return self.decoder.get_last_frame()
+
 
 class BulkChannel:
     # USB协议相关
@@ -1,26 +1,39 @@
 from backends.abstract_sensor_driver import SensorDriver
 import json
 from backends.usb_backend import UsbBackend
+from backends.simulated_backend import SimulatedBackend
 import os
 
 
 
-def trans(frame):
-    # 修正
-    COEF = -0.037
-    PERIOD = 8
-    COL_OFFSET = -7
-    ROW_OFFSET = 1
-    COL_FROM = range(7, 71, PERIOD)
+class CrosstalkCorrection:
+    # 修正：第col_from列的值按比例coef串扰到(row + row_offset, col_from + col_offset)
+    # col_from取range(col_begin, col_end, period)。参数可在config_array的"trans"中配置
+    # 预先算好源区域与目标区域的切片，每帧只需一次带步长的切片运算，原地完成
+
+    def __init__(self, sensor_shape, coef=-0.037, period=8, col_offset=-7, row_offset=1, col_begin=7, col_end=71):
+        self.coef = coef
+        row_count, column_count = sensor_shape
+        # 只保留源、目标都在阵列内的部分
+        columns_from = [col_from for col_from in range(col_begin, col_end, period)
+                        if 0 <= col_from < column_count and 0 <= col_from + col_offset < column_count]
+        row_begin = max(0, -row_offset)
+        row_end = min(row_count, row_count - row_offset)
+        if columns_from and row_begin < row_end:
+            self.slice_from = (slice(row_begin, row_end),
+                               slice(columns_from[0], columns_from[-1] + 1, period))
+            self.slice_to = (slice(row_begin + row_offset, row_end + row_offset),
+                             slice(columns_from[0] + col_offset, columns_from[-1] + col_offset + 1, period))
+        else:
+            self.slice_from = None
+            self.slice_to = None
+
+    def __call__(self, frame):
+        if self.slice_from is not None:
+            frame[self.slice_to] += (frame[self.slice_from] * self.coef).astype(frame.dtype)
 
-    for col_from in COL_FROM:
-        col_to = col_from + COL_OFFSET
-        for row_from in range(0, 64):
-            row_to = row_from + ROW_OFFSET
-            if col_to < 0 or col_to >= 64 or row_to < 0 or row_to >= 64:
-                continue
-            frame[row_to, col_to] += (frame[row_from, col_from] * COEF).astype(frame.dtype)
-    pass
+
+trans = CrosstalkCorrection((64, 64))  # 默认参数
 
 
 class UsbSensorDriver(SensorDriver):
@@ -31,13 +44,22 @@ class UsbSensorDriver(SensorDriver):
     def __init__(self, sensor_shape, config_array):
         super(UsbSensorDriver, self).__init__()
         self.SENSOR_SHAPE = sensor_shape
-        self.sensor_backend = UsbBackend(config_array)  # 后端自带缓存，一定范围内不丢数据
-        self.trans = trans
+        if config_array.get('simulation') is not None:
+            self.sensor_backend = SimulatedBackend(config_array)  # 无硬件时的模拟采集卡
+        else:
+            self.sensor_backend = UsbBackend(config_array)  # 后端自带缓存，一定范围内不丢数据
+        trans_config = config_array.get('trans', {})  # 为null时不做修正
+        self.trans = CrosstalkCorrection(sensor_shape, **trans_config) if trans_config is not None \
+            else (lambda frame: None)
 
     @property
     def connected(self):
         return self.sensor_backend.active
 
+    @property
+    def stats(self):
+        return self.sensor_backend.stats
+
     def get_available_sources(self):
         # 获取可用的USB设备
         names_found = self.sensor_backend.get_available_sources()
@@ -69,6 +91,22 @@ class UsbSensorDriver(SensorDriver):
             self.trans(data)
         return data, t
 
+    def get_frame(self):
+        if self.sensor_backend.err_queue:
+            raise self.sensor_backend.err_queue.popleft()
+        frame = self.sensor_backend.get_frame()
+        if frame is not None:
+            self.trans(frame.data)
+        return frame
+
+    def get_last_frame(self):
+        if self.sensor_backend.err_queue:
+            raise self.sensor_backend.err_queue.popleft()
+        frame = self.sensor_backend.get_last_frame()
+        if frame is not None:
+            self.trans(frame.data)
+        return frame
+
 class UsbSensorDriverWithValidation(UsbSensorDriver):
 
     def __init__(self, sensor_shape, config_array):
@@ -173,6 +211,34 @@ class GLUsbSensorDriver(UsbSensorDriver):
 
 if __name__ == '__main__':
     import time
+    import numpy as np
+
+    def trans_loop(frame, coef=-0.037, period=8, col_offset=-7, row_offset=1, col_begin=7, col_end=71):
+        # 原先的逐点修正，仅用于对比。原为固定的64 * 64和默认参数
+        row_count, column_count = frame.shape
+        for col_from in range(col_begin, col_end, period):
+            col_to = col_from + col_offset
+            for row_from in range(0, row_count):
+                row_to = row_from + row_offset
+                if col_to < 0 or col_to >= column_count or row_to < 0 or row_to >= row_count:
+                    continue
+                frame[row_to, col_to] += (frame[row_from, col_from] * coef).astype(frame.dtype)
+
+    # CrosstalkCorrection与逐点修正逐位一致。第二组参数的目标列、目标行超出阵列边缘，须裁掉
+    # （逐点修正不检查源列，源列须在阵列内）
+    rng = np.random.default_rng(0)
+    for shape, trans_config in [((64, 64), {}),
+                                ((48, 40), {'coef': 0.11, 'period': 5, 'col_offset': 3, 'row_offset': -2,
+                                            'col_begin': 2, 'col_end': 40})]:
+        correction = CrosstalkCorrection(shape, **trans_config)
+        for dtype in [np.int16, np.float32, np.float64]:
+            frame = (rng.random(shape) * 20000 - 5000).astype(dtype)
+            expected = frame.copy()
+            trans_loop(expected, **trans_config)
+            correction(frame)
+            assert frame.tobytes() == expected.tobytes(), (shape, dtype)
+    print('CrosstalkCorrection与逐点修正一致')
+
     driver = LargeUsbSensorDriver()
     driver.connect(0)
     while True:
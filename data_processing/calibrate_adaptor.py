@@ -81,6 +81,10 @@ class CalibrateAdaptor:
         # force_frame = average_2x2_blocks(force_frame)
         return force_frame
 
+    def transform_batch(self, voltage_frames):
+        # 多帧的transform_frame，帧的维度在前
+        return self.algorithm.transform_streaming_batch(voltage_frames)
+
     def __bool__(self):
         return self.algorithm_class.IS_NOT_IDLE
 
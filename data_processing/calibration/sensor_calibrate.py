@@ -101,6 +101,16 @@ class Algorithm:
         """
         return sensor_reading
 
+    def transform_streaming_batch(self, sensor_readings):
+        """
+        依次实时变换多帧数据，结果与逐帧调用transform_streaming相同
+        :param sensor_readings: (帧数, ...)的读数
+        :return: 力
+        """
+        if type(self).transform_streaming is Algorithm.transform_streaming:
+            return sensor_readings
+        return np.stack([self.transform_streaming(_) for _ in sensor_readings])
+
     def save(self) -> str:
         """
         导出标定文件的文本
@@ -149,7 +159,10 @@ class ManualDirectionLinearAlgorithm(Algorithm):
         self.segments = np.ndarray((0, ))
         self.nodes_center = np.ndarray((0, ))
         self.nodes_hysteresis = np.ndarray((0, ))
-        self.median = Interpolation(interp=1, blur=0.0, sensor_shape=sensor_class.SENSOR_SHAPE, use_median=False)
+        # 拟合与transform以float64运算；实时变换的结果转为VALUE_DTYPE
+        self.value_dtype = np.dtype(getattr(sensor_class, 'VALUE_DTYPE', float))
+        self.median = Interpolation(interp=1, blur=0.0, sensor_shape=sensor_class.SENSOR_SHAPE, use_median=False,
+                                    dtype=float)
         #
         self.streaming_voltage = None
         self.streaming_trend = np.zeros(shape=sensor_class.SENSOR_SHAPE, dtype=float)
@@ -204,7 +217,9 @@ class ManualDirectionLinearAlgorithm(Algorithm):
         interp_hysteresis = interp1d(self.segments, self.nodes_hysteresis, kind='linear',
                                      bounds_error=False,
                                      fill_value=(self.nodes_hysteresis[0], self.nodes_hysteresis[-1]))
-        force_est = sensor_reading.__array_wrap__(interp_center(sensor_reading) + interp_hysteresis(sensor_reading) * self.streaming_trend)
+        force_est = sensor_reading.__array_wrap__(
+            (interp_center(sensor_reading) + interp_hysteresis(sensor_reading) * self.streaming_trend)
+            .astype(self.value_dtype, copy=False))
         return force_est
 
     def fit(self, ignore=None, extra=None):
@@ -15,7 +15,9 @@ def extract_data(path):
         assert path.endswith('.db')
         connection = sqlite3.connect(path)
         data = pd.read_sql(sql='SELECT * FROM data', con=connection)
-        data_time = pd.DataFrame(data[['time', 'time_after_begin']])
+        # capture_ns、frame_number为采集时刻的perf_counter_ns与包头帧号，较早的文件中没有
+        data_time = pd.DataFrame(data[[c for c in ['time', 'time_after_begin', 'capture_ns', 'frame_number']
+                                       if c in data.columns]])
         to_be_concatenated = [data_time]
         for c in data.columns:
             if c.startswith('data_row_'):
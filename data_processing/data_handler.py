@@ -3,8 +3,12 @@ import warnings
 from collections import deque
 import numpy as np
 import atexit
+import functools
 from . import filters as preprocessing
 from .interpolation import Interpolation
+from .ring_history import RingHistory
+from .pipeline_stats import PipelineStats
+from .tracing import TracingEngine
 import json
 import sqlite3
 from .convert_data import convert_db_to_csv
@@ -144,6 +148,9 @@ class BalanceSensorCalibrationAdapter:
         # 应用线性校准：y = kx + b
         calibrated_data = self.coefficient * calibrated_data + self.bias
         
+        # 浮点输入保持其dtype，不因float64的校准映射而提升
+        if raw_data.dtype.kind == 'f':
+            calibrated_data = calibrated_data.astype(raw_data.dtype, copy=False)
         return calibrated_data
     
     def get_info(self):
@@ -166,7 +173,11 @@ class BalanceSensorCalibrationAdapter:
 class AICalibrationAdapter:
     """AI校准适配器"""
 
-    def __init__(self):
+    def __init__(self, dtype=np.float32):
+        """
+        :param dtype: 运算及输出的dtype。为np.float64时以双精度运算，否则与模型系数相同，为单精度
+        """
+        self.dtype = np.dtype(dtype)
         self.coeffs = None
         self.device = None
         self.is_loaded = False
@@ -211,21 +222,22 @@ class AICalibrationAdapter:
                 return raw_data
 
             # 转换为PyTorch张量
-            raw_tensor = torch.from_numpy(raw_data).float().to(self.device)
+            raw_tensor = torch.from_numpy(raw_data).to(self.device, self.__torch_dtype())
             raw_flat = raw_tensor.view(-1)  # 展平为4096维向量
 
             # 应用二次多项式校准: y = a*x^2 + b*x + c
             x = raw_flat
-            a = self.coeffs[:, 0]  # 二次项系数
-            b = self.coeffs[:, 1]  # 一次项系数
-            c = self.coeffs[:, 2]  # 常数项
+            coeffs = self.coeffs.to(raw_tensor.dtype)
+            a = coeffs[:, 0]  # 二次项系数
+            b = coeffs[:, 1]  # 一次项系数
+            c = coeffs[:, 2]  # 常数项
 
             # 并行计算校准
             calibrated_flat = a * x**2 + b * x + c
 
             # 恢复为64x64矩阵
             calibrated_tensor = calibrated_flat.view(64, 64)
-            calibrated_data = calibrated_tensor.cpu().numpy()
+            calibrated_data = calibrated_tensor.cpu().numpy().astype(self.dtype, copy=False)
 
             return calibrated_data
 
@@ -233,6 +245,31 @@ class AICalibrationAdapter:
             print(f"⚠️ AI校准应用失败: {e}")
             return raw_data
 
+    def apply_calibration_batch(self, raw_data):
+        """对(帧数, 64, 64)的多帧应用AI校准，逐点运算与apply_calibration相同"""
+        if not self.is_loaded or self.coeffs is None:
+            return raw_data
+
+        try:
+            if raw_data.shape[1:] != (64, 64):
+                print(f"⚠️ 输入数据形状错误: {raw_data.shape[1:]}，期望 (64, 64)")
+                return raw_data
+
+            x = torch.from_numpy(raw_data).to(self.device, self.__torch_dtype()).view(raw_data.shape[0], -1)
+            coeffs = self.coeffs.to(x.dtype)
+            a = coeffs[:, 0]
+            b = coeffs[:, 1]
+            c = coeffs[:, 2]
+            calibrated_flat = a * x**2 + b * x + c
+            return calibrated_flat.view(raw_data.shape).cpu().numpy().astype(self.dtype, copy=False)
+
+        except Exception as e:
+            print(f"⚠️ AI校准应用失败: {e}")
+            return raw_data
+
+    def __torch_dtype(self):
+        return torch.float64 if self.dtype == np.float64 else torch.float32
+
     def get_info(self):
         """获取AI校准信息"""
         if not self.is_loaded:
@@ -249,7 +286,35 @@ class AICalibrationAdapter:
             } if self.coeffs is not None else None
         }
 
-VALUE_DTYPE = float
+WORKER_IDLE = 0.001  # 后台处理线程无新数据时的等待(s)
+SNAPSHOT_FIELDS = ('value', 'time', 'maximum', 'summed', 'tracings')  # snapshot()可复制的数据。'tracings'含t_tracing
+
+
+def with_process_lock(func):
+    # 修改处理流程（滤波器、置零、标定、追踪点等）的操作，与后台线程的处理互斥
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.process_lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+class DataSnapshot:
+    # DataHandler在某一时刻的一致快照，供界面绘制。各数组为副本，绘制时无需持有DataHandler.lock
+    # 只复制fields中列出的数据，其余为None
+
+    def __init__(self, version, fields, value, capture_ns, time, maximum, summed, t_tracing, tracings,
+                 tracing_points):
+        self.version = version  # 处理过的帧数，清空数据时也会增加。版本相同即内容相同
+        self.fields = fields  # frozenset，复制了的数据
+        self.value = value  # 最新一帧的value，无数据时为None
+        self.capture_ns = capture_ns  # 最新一帧的采集时刻，未知时为-1
+        self.time = time
+        self.maximum = maximum
+        self.summed = summed
+        self.t_tracing = t_tracing
+        self.tracings = tracings  # (帧数, 追踪数)的数组，第k列对应tracing_points[k]
+        self.tracing_points = tracing_points
 
 
 class DataHandler:
@@ -265,14 +330,19 @@ class DataHandler:
         """
         self.max_len = max_len
         self.driver = template_sensor_driver()  # 传感器驱动
+        # 处理流程中浮点数值的dtype。默认float32；标定拟合等需要更高精度时设为"float64"
+        # 写入驱动实例，以self.driver构造的滤波器、标定器均按此运算
+        self.value_dtype = np.dtype(config.get("value_dtype", template_sensor_driver.VALUE_DTYPE))
+        self.driver.VALUE_DTYPE = self.value_dtype
         # 滤波器。调用顺序见trigger方法
-        self.filter_time = preprocessing.Filter(template_sensor_driver)  # 当前的时间滤波。可被设置
-        self.filter_frame = preprocessing.Filter(template_sensor_driver)  # 当前的空间滤波。可被设置
+        self.filter_time = preprocessing.Filter(self.driver)  # 当前的时间滤波。可被设置
+        self.filter_frame = preprocessing.Filter(self.driver)  # 当前的空间滤波。可被设置
         self.filters_for_each = None
-        self.filter_after_zero = preprocessing.Filter(template_sensor_driver)
+        self.filter_after_zero = preprocessing.Filter(self.driver)
         self.filters_for_each_after_zero = None
-        self.preset_filters = preprocessing.build_preset_filters(template_sensor_driver)  # 下拉菜单里可设置的滤波器
-        self.interpolation = Interpolation(1, 0., template_sensor_driver.SENSOR_SHAPE)  # 插值。可被设置
+        self.preset_filters = preprocessing.build_preset_filters(self.driver)  # 下拉菜单里可设置的滤波器
+        self.interpolation = Interpolation(1, 0., template_sensor_driver.SENSOR_SHAPE,
+                                           dtype=self.value_dtype)  # 插值。可被设置
         # region_count为0表示为单片；否则为分片
         try:
             self.region_indices = template_sensor_driver.range_mapping.keys()
@@ -287,24 +357,37 @@ class DataHandler:
         self.using_balance_calibration = False
 
         # 添加AI校准适配器
-        self.ai_calibration_adaptor = AICalibrationAdapter()
+        self.ai_calibration_adaptor = AICalibrationAdapter(self.value_dtype)
         self.using_ai_calibration = False
-        # 数据容器
+        # 数据容器。RingHistory与deque用法相同，np.asarray(...)不复制数据
         self.begin_time = None
-        self.data = deque(maxlen=self.max_len)  # 直接从SensorDriver获得的数据
-        self.filtered_data = deque(maxlen=self.max_len)  # 直接从SensorDriver获得的数据
-        self.value_before_zero = deque(maxlen=self.max_len)
-        self.value = deque(maxlen=self.max_len)  # 经过所有处理，但未通过interpolation，也未做对数尺度变换。对自研卡，未开启标定时，是电阻(kΩ)的倒数
-        self.time = deque(maxlen=self.max_len)  # 从connect后首个采集点开始到现在的时间
-        self.time_ms = deque(maxlen=self.max_len)  # ms上的整型。通讯专用
+        self.data = RingHistory(self.max_len)  # 直接从SensorDriver获得的数据
+        self.filtered_data = RingHistory(self.max_len)  # 直接从SensorDriver获得的数据
+        self.value_before_zero = RingHistory(self.max_len)
+        self.value = RingHistory(self.max_len)  # 经过所有处理，但未通过interpolation，也未做对数尺度变换。对自研卡，未开启标定时，是电阻(kΩ)的倒数
+        self.time = RingHistory(self.max_len)  # 从connect后首个采集点开始到现在的时间
+        self.time_ms = RingHistory(self.max_len)  # ms上的整型。通讯专用
+        self.capture_ns = RingHistory(self.max_len)  # 采集时刻的time.perf_counter_ns()，在读取硬件时取得。重放时为-1
+        self.frame_numbers = RingHistory(self.max_len)  # 包头中的8位帧号。未知时为-1
+        self.last_frame_number = None
+        self.frames_skipped = 0  # 按帧号推算未到达的帧数。包括抽取策略丢弃的帧，减去driver.stats中的frames_decimated即为丢失的帧
         self.zero = np.zeros(template_sensor_driver.SENSOR_SHAPE, dtype=template_sensor_driver.DATA_TYPE)  # 零点
         self.value_zero = np.zeros(template_sensor_driver.SENSOR_SHAPE, dtype=template_sensor_driver.DATA_TYPE)
-        self.maximum = deque(maxlen=self.max_len)  # 峰值
-        self.summed = deque(maxlen=self.max_len)  # 总值
-        self.tracings = deque(maxlen=self.max_len)  # 追踪点。Experimental修改：多个追踪点
-        self.t_tracing = deque(maxlen=self.max_len)  # 追踪点的时间。由于更新追踪点时会清空，故单独记录
-        self.tracing_points = []  # 当前的追踪点。Experimental修改：多个追踪点
+        self.maximum = RingHistory(self.max_len)  # 峰值
+        self.summed = RingHistory(self.max_len)  # 总值
+        self.tracings = RingHistory(self.max_len)  # 追踪值。每帧一个(追踪数, )的数组，np.asarray(self.tracings)即(帧数, 追踪数)
+        self.t_tracing = RingHistory(self.max_len)  # 追踪点的时间。由于更新追踪点时会清空，故单独记录
+        self.tracing_points = []  # 当前的追踪点(i, j)或区域(top, left, bottom, right)
+        self.tracing_engine = TracingEngine()
         self.lock = threading.Lock()
+        self.version = 0  # 每处理一帧或清空数据时加1
+        self.last_snapshot = None
+        # 后台处理线程。运行时由其处理数据，界面定时器调用trigger只转发其异常
+        self.process_lock = threading.RLock()
+        self.worker = None
+        self.worker_stop = None
+        self.worker_errors = deque(maxlen=1)
+        self.use_worker = config.get("processing_thread", False)  # connect后自动启动后台线程
         self.zero_set = False
         # 保存
         self.output_file = None
@@ -315,6 +398,11 @@ class DataHandler:
         #
         self.dump_interval = config.get("dump_interval", 10.) * 0.001
         self.next_dump = 0.
+        # 批处理：一次取出驱动中所有待处理的帧，各环节整体处理。结果与逐帧处理相同
+        # 仅用于单片传感器；分片传感器、重放时，及驱动不支持get_batch时逐帧处理
+        self.batch_mode = config.get("batch_trigger", False)
+        # 各环节耗时及端到端延迟的统计。可随时设置pipeline_stats.enabled开关
+        self.pipeline_stats = PipelineStats(config.get("pipeline_stats", False))
         #
         self.play_data = None
         self.play_flag = False
@@ -332,7 +420,7 @@ class DataHandler:
             self.path_db = path
             self.cursor = self.output_file.cursor()
             if not self.region_indices:  # 无分区
-                command = ('create table data (time float, time_after_begin float, '
+                command = ('create table data (time float, time_after_begin float, capture_ns int, frame_number int, '
                           + ', '.join([f'data_row_{i} text'
                                       for i in range(self.driver.SENSOR_SHAPE[0])
                                       ]) + ','
@@ -341,7 +429,7 @@ class DataHandler:
                            + ')')
             else:
                 # SplitDataDict 模式
-                command = ('create table data (time float, time_after_begin float, '
+                command = ('create table data (time float, time_after_begin float, capture_ns int, frame_number int, '
                           + ', '.join([f'data_region_{i}_row_{j} text'
                                        for i in self.region_indices
                                        for j in range(self.driver.get_zeros(i).shape[0])
@@ -356,7 +444,7 @@ class DataHandler:
         except Exception as e:
             raise e
 
-    def write_to_file(self, time_now, time_after_begin, data, summed, maximum):
+    def write_to_file(self, time_now, time_after_begin, capture_ns, frame_number, data, summed, maximum):
         #
         if self.output_file is not None:
             if time_after_begin - self.next_dump > 2 * self.dump_interval:
@@ -365,7 +453,7 @@ class DataHandler:
                 self.next_dump = time_after_begin
             if time_after_begin >= self.next_dump:
                 if not self.region_indices:
-                    command = (f'insert into data values ({time_now}, {time_after_begin}, '
+                    command = (f'insert into data values ({time_now}, {time_after_begin}, {capture_ns}, {frame_number}, '
                                + ', '.join(['\"' + json.dumps(_.tolist()) + '\"' for _ in data]) + ','
                                + ', '.join([str(_) for _ in [int(self.zero_set), int(self.using_calibration),
                                                              summed, maximum]]) +
@@ -373,7 +461,7 @@ class DataHandler:
                 else:
                     # SplitDataDict 模式
                     data_list = sum([['\"' + json.dumps(_.tolist()) + '\"' for _ in data[k]] for k in data.keys()], [])
-                    command = (f'insert into data values ({time_now}, {time_after_begin}, '
+                    command = (f'insert into data values ({time_now}, {time_after_begin}, {capture_ns}, {frame_number}, '
                                + ', '.join(data_list) + ','
                                + ', '.join([str(_) for _ in [int(self.zero_set), int(self.using_calibration)]]) + ','
                                + ', '.join([str(_) for _ in [summed, maximum]]) + ')')
@@ -409,18 +497,25 @@ class DataHandler:
         self.value.clear()
         self.time.clear()
         self.time_ms.clear()
+        self.capture_ns.clear()
+        self.frame_numbers.clear()
+        self.last_frame_number = None
         self.maximum.clear()
         self.summed.clear()
         self.tracings.clear()
         self.t_tracing.clear()
+        self.version += 1
         self.lock.release()
 
     def connect(self, port):
         self.begin_time = None
         flag = self.driver.connect(port)  # 会因import的驱动类型而改变
+        if flag and self.use_worker:
+            self.start_worker()
         return flag
 
     def disconnect(self):
+        self.stop_worker()
         self.close_output_file()
         self.clear()
         flag = self.driver.disconnect()
@@ -489,24 +584,118 @@ class DataHandler:
                 data = None
         return data, time_now
 
+    # 后台处理
+
+    def start_worker(self):
+        """
+        启动后台处理线程，驱动中的数据一到即处理，不再受界面刷新的影响
+        界面仍可照常定时调用trigger，此时只转发后台线程的异常；读取数据用snapshot
+        """
+        if self.worker is not None:
+            return
+        self.worker_stop = threading.Event()
+        self.worker = threading.Thread(target=self.__work_forever, args=(self.worker_stop, ), daemon=True)
+        self.worker.start()
+
+    def stop_worker(self):
+        if self.worker is None:
+            return
+        self.worker_stop.set()
+        if self.worker is not threading.current_thread():
+            self.worker.join()
+        self.worker = None
+
+    @property
+    def worker_running(self):
+        return self.worker is not None
+
+    def __work_forever(self, stop_event):
+        while not stop_event.is_set():
+            version = self.version
+            try:
+                with self.process_lock:
+                    self.__process()
+            except Exception as e:
+                # 交由下一次trigger抛出，随后回到定时器驱动的处理
+                self.worker_errors.append(e)
+                return
+            if self.version == version:
+                stop_event.wait(WORKER_IDLE)
+
+    def snapshot(self, fields=SNAPSHOT_FIELDS):
+        """
+        当前数据的一致快照。自上次调用后没有新数据、且fields相同时，返回同一对象
+        历史记录每帧都在变，快照须复制；只列出绘制用到的数据，可省去其余历史记录的复制
+        :param fields: SNAPSHOT_FIELDS中的若干项
+        :return: DataSnapshot。未列出的数据为None，tracing_points总是有
+        """
+        fields = frozenset(fields)
+        assert fields <= frozenset(SNAPSHOT_FIELDS), fields
+        snapshot = self.last_snapshot
+        if snapshot is not None and snapshot.version == self.version and snapshot.fields == fields:
+            return snapshot
+        with self.lock:
+            tracings = None
+            if 'tracings' in fields:
+                tracings = np.array(self.tracings) if self.tracings \
+                    else np.zeros((0, self.tracing_points.__len__()))
+            snapshot = DataSnapshot(self.version, fields,
+                                    self.value[-1].copy() if self.value and 'value' in fields else None,
+                                    int(self.capture_ns[-1]) if self.capture_ns else -1,
+                                    np.array(self.time) if 'time' in fields else None,
+                                    np.array(self.maximum) if 'maximum' in fields else None,
+                                    np.array(self.summed) if 'summed' in fields else None,
+                                    np.array(self.t_tracing) if 'tracings' in fields else None,
+                                    tracings,
+                                    list(self.tracing_points))
+        self.last_snapshot = snapshot
+        return snapshot
+
     def trigger(self):
         """
         核心触发
         :return: None
         """
+        if self.worker is not None:
+            if self.worker_errors:
+                self.worker = None
+                raise self.worker_errors.popleft()
+            if self.worker.is_alive():
+                return
+            self.worker = None
+        with self.process_lock:
+            self.__process()
+
+    def __process(self):
+        # 处理驱动中待处理的数据，一次至多MAX_IN帧
+        if self.batch_mode and not self.play_flag and not self.region_indices:
+            try:
+                self.__trigger_batch()
+                return
+            except NotImplementedError:
+                self.batch_mode = False
+        stats = self.pipeline_stats
         count_in = self.MAX_IN  # 一次触发最大读取数据量。避免提取数据的速度赶不上SensorDriver累积数据速度
         while count_in:
             count_in -= 1
+            t = stats.tic()
             data, time_now = self.get_data()  # 从其缓存中最早的数据开始逐一提取和处理
             if data is not None:
+                t = stats.toc('get_data', t)
                 # 以下为各类滤波器处理顺序
-                _ = self.filter_time.filter(self.filter_frame.filter(data))
+                _ = self.filter_frame.filter(data)
+                t = stats.toc('filter_frame', t)
+                _ = self.filter_time.filter(_)
+                t = stats.toc('filter_time', t)
                 if self.filters_for_each is not None:
                     for k in self.filters_for_each:
                         _[k] = self.filters_for_each[k].filter(_[k])
+                    t = stats.toc('filters_for_each', t)
                 
                 # 应用原始校准（如果启用）
-                value = self.calibration_adaptor.transform_frame(_.astype(float) * self.driver.SCALE)
+                value = self.calibration_adaptor.transform_frame(
+                    _.astype(self.value_dtype) * self.value_dtype.type(self.driver.SCALE))
+                t = stats.toc('calibration', t)
                 
                 # # 应用balance-sensor校准（如果启用）
                 # if self.using_balance_calibration:
@@ -515,50 +704,104 @@ class DataHandler:
                 # 应用AI校准（如果启用）
                 if self.using_ai_calibration:
                     value = self.ai_calibration_adaptor.apply_calibration(value)
+                    t = stats.toc('ai_calibration', t)
                 
                 value = self.interpolation.smooth(value)
+                t = stats.toc('interpolation', t)
                 value_before_zero = value
                 _ = self.filter_after_zero.filter(value_before_zero - self.zero)
                 if self.filters_for_each_after_zero is not None:
                     for k in self.filters_for_each_after_zero:
                         _[k] = self.filters_for_each_after_zero[k].filter(_[k])
                 value = np.maximum(_, 0.)
+                t = stats.toc('filter_after_zero', t)
                 # 时间
                 if self.begin_time is None:
                     self.begin_time = time_now
-                time_after_begin = time_now - self.begin_time
+                time_after_begin = float(time_now - self.begin_time)
                 # 导出基础特征
                 summed = np.sum(value)
                 maximum = np.max(value)
-                tracings = []
-                for tracing_point in self.tracing_points:
-                    tracing = np.mean(np.asarray(value)[
-                                                       tracing_point[0] * self.interpolation.interp
-                                                       : (tracing_point[0] + 1) * self.interpolation.interp,
-                                                       tracing_point[1] * self.interpolation.interp
-                                                       : (tracing_point[1] + 1) * self.interpolation.interp])
-                    tracings.append(tracing)
-
-                self.lock.acquire()
-                self.data.append(data)
-                self.value_before_zero.append(value_before_zero)
-                self.value.append(value)
-                self.time.append(time_after_begin)
-                self.t_tracing.append(time_after_begin)
-                self.time_ms.append(np.array([(time_after_begin * 1e3) % 10000], dtype='>i2'))  # ms
-                self.maximum.append(maximum)
-                self.summed.append(summed)
-                self.tracings.append(tracings)
-                self.lock.release()
-                #
-                try:
-                    self.write_to_file(time_now, time_after_begin, data, summed, maximum)
-                except TypeError:
-                    warnings.warn('未完成保存模块')
+                tracings = self.tracing_engine(value, self.interpolation.interp)
+                t = stats.toc('features', t)
+
+                self.__append(data, value_before_zero, value, time_now, time_after_begin, summed, maximum, tracings, t)
             else:
                 break
         # print(f"取得数据{self.MAX_IN - count_in}条")
 
+    def __trigger_batch(self):
+        # 与trigger中的逐帧处理一一对应，各环节作用于(帧数, H, W)的数组
+        # 各环节的耗时按帧数平均后计入
+        stats = self.pipeline_stats
+        t = stats.tic()
+        data, times = self.driver.get_batch(self.MAX_IN)
+        if data is None:
+            return
+        n = data.shape[0]
+        t = stats.toc('get_data', t, n)
+        _ = self.filter_frame.filter_batch(data)
+        t = stats.toc('filter_frame', t, n)
+        _ = self.filter_time.filter_batch(_)
+        t = stats.toc('filter_time', t, n)
+        value = self.calibration_adaptor.transform_batch(
+            _.astype(self.value_dtype) * self.value_dtype.type(self.driver.SCALE))
+        t = stats.toc('calibration', t, n)
+        if self.using_ai_calibration:
+            value = self.ai_calibration_adaptor.apply_calibration_batch(value)
+            t = stats.toc('ai_calibration', t, n)
+        value = self.interpolation.smooth_batch(value)
+        t = stats.toc('interpolation', t, n)
+        value_before_zero = value
+        value = np.maximum(self.filter_after_zero.filter_batch(value_before_zero - self.zero), 0.)
+        t = stats.toc('filter_after_zero', t, n)
+        if self.begin_time is None:
+            self.begin_time = times[0]
+        summed = np.sum(value, axis=(1, 2))
+        maximum = np.max(value, axis=(1, 2))
+        tracings = self.tracing_engine(value, self.interpolation.interp)
+        t = stats.toc('features', t, n)
+        for idx, time_now in enumerate(times):
+            self.__append(data[idx], value_before_zero[idx], value[idx], time_now, float(time_now - self.begin_time),
+                          summed[idx], maximum[idx], tracings[idx], t)
+            t = stats.tic()
+
+    def __append(self, data, value_before_zero, value, time_now, time_after_begin, summed, maximum, tracings, t=None):
+        """
+        :param t: pipeline_stats的计时，用于统计写入及保存的耗时
+        """
+        # 来自硬件的time_now为backends.decoding.FrameTime，附有采集时刻与帧号；重放时为float
+        capture_ns = getattr(time_now, 'ns', -1)
+        frame_number = getattr(time_now, 'frame_number', -1)
+        if frame_number >= 0:
+            if self.last_frame_number is not None:
+                self.frames_skipped += (frame_number - self.last_frame_number - 1) % 256
+            self.last_frame_number = frame_number
+        self.lock.acquire()
+        self.data.append(data)
+        self.value_before_zero.append(value_before_zero)
+        self.value.append(value)
+        self.time.append(time_after_begin)
+        self.t_tracing.append(time_after_begin)
+        self.time_ms.append(np.array([(time_after_begin * 1e3) % 10000], dtype='>i2'))  # ms
+        self.capture_ns.append(capture_ns)
+        self.frame_numbers.append(frame_number)
+        self.maximum.append(maximum)
+        self.summed.append(summed)
+        self.tracings.append(tracings)
+        self.version += 1
+        self.lock.release()
+        t = self.pipeline_stats.toc('append', t)
+        self.pipeline_stats.latency('capture_to_processed', capture_ns)
+        #
+        try:
+            self.write_to_file(float(time_now), time_after_begin, capture_ns, frame_number, data, summed, maximum)
+        except TypeError:
+            warnings.warn('未完成保存模块')
+        if self.output_file is not None:
+            self.pipeline_stats.toc('write_to_file', t)
+
+    @with_process_lock
     def set_zero(self) -> bool:
         """
         置零
@@ -574,6 +817,7 @@ class DataHandler:
             # print('数据不足，无法置零')
             return False
 
+    @with_process_lock
     def abandon_zero(self):
         """
         解除置零
@@ -583,6 +827,7 @@ class DataHandler:
                              dtype=self.driver.DATA_TYPE)
         self.zero_set = False
 
+    @with_process_lock
     def set_filter(self, filter_name_frame, filter_name_time):
         """
         在预设模组中选择滤波器。注意空间滤波器和时间滤波器实际没有约束
@@ -598,6 +843,7 @@ class DataHandler:
         except KeyError:
             raise Exception('指定的滤波器不存在')
 
+    @with_process_lock
     def set_tracing(self, i, j):
         """
         添加追踪点
@@ -607,28 +853,51 @@ class DataHandler:
         """
         # 鼠标选点时，设置追踪点
         if 0 <= i < self.driver.SENSOR_SHAPE[0] and 0 <= j < self.driver.SENSOR_SHAPE[1]:
-            if (i, j) in self.tracing_points:
-                # 如果点已存在，则删除
-                self.tracing_points.remove((i, j))
-            else:
-                self.tracing_points.append((i, j))
-            self.t_tracing.clear()
-            self.tracings.clear()
+            return self.__toggle_tracing((i, j))
         else:
-            self.tracing_points.clear()
+            return self.__replace_tracing([])
+
+    @with_process_lock
+    def set_tracing_region(self, top, left, bottom, right):
+        """
+        添加追踪区域，追踪其中各点的均值。已存在时删除
+        :param top: 起始行
+        :param left: 起始列
+        :param bottom: 结束行，不含
+        :param right: 结束列，不含
+        :return: 正在追踪的点数与区域数之和
+        """
+        assert 0 <= top < bottom <= self.driver.SENSOR_SHAPE[0] and 0 <= left < right <= self.driver.SENSOR_SHAPE[1]
+        return self.__toggle_tracing((top, left, bottom, right))
+
+    def __toggle_tracing(self, point):
+        if point in self.tracing_points:
+            # 如果点已存在，则删除
+            return self.__replace_tracing([_ for _ in self.tracing_points if _ != point])
+        else:
+            return self.__replace_tracing(self.tracing_points + [point])
+
+    def __replace_tracing(self, tracing_points):
+        # 追踪对象与已有追踪值一并更换，snapshot读到的两者总是一致
+        with self.lock:
+            self.tracing_points = tracing_points
+            self.tracing_engine.set_points(tracing_points)
             self.t_tracing.clear()
             self.tracings.clear()
+            self.version += 1
         return self.tracing_points.__len__()
 
+    @with_process_lock
     def set_interpolation_and_blur(self, interpolate, blur):
         assert interpolate == int(interpolate)
         assert 1 <= interpolate <= 8
         assert blur == float(blur)
         assert 0. <= blur <= 8.
-        self.interpolation = Interpolation(interpolate, blur, self.driver.SENSOR_SHAPE)
+        self.interpolation = Interpolation(interpolate, blur, self.driver.SENSOR_SHAPE, dtype=self.value_dtype)
         self.abandon_zero()
         self.clear()
 
+    @with_process_lock
     def set_calibrator(self, path, forced_to_use_clb=False):
         try:
             self.calibration_adaptor = CalibrateAdaptor(self.driver, ManualDirectionLinearAlgorithm)
@@ -641,6 +910,7 @@ class DataHandler:
             self.abandon_calibrator()
             raise e
 
+    @with_process_lock
     def abandon_calibrator(self):
         """
         解除标定
@@ -649,6 +919,7 @@ class DataHandler:
         self.using_calibration = False
         self.calibration_adaptor = CalibrateAdaptor(self.driver, Algorithm)
     
+    @with_process_lock
     def set_balance_calibration(self, filepath):
         """
         设置balance-sensor校准文件
@@ -668,6 +939,7 @@ class DataHandler:
             print(f"⚠️ 设置balance-sensor校准时出错: {e}")
             return False
     
+    @with_process_lock
     def abandon_balance_calibration(self):
         """
         解除balance-sensor校准
@@ -684,6 +956,7 @@ class DataHandler:
         """
         return self.balance_calibration_adaptor.get_info()
 
+    @with_process_lock
     def set_ai_calibration(self, filepath):
         """
         设置AI校准模型
@@ -703,13 +976,14 @@ class DataHandler:
             print(f"⚠️ 设置AI校准时出错: {e}")
             return False
 
+    @with_process_lock
     def abandon_ai_calibration(self):
         """
         解除AI校准
         :return:
         """
         self.using_ai_calibration = False
-        self.ai_calibration_adaptor = AICalibrationAdapter()
+        self.ai_calibration_adaptor = AICalibrationAdapter(self.value_dtype)
         print("✅ 已解除AI校准")
 
     def get_ai_calibration_info(self):
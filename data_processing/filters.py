@@ -1,10 +1,11 @@
 import numpy as np
+from scipy.signal import lfilter
 
 # 添加一个装饰器。如果filter输入的x不是一个numpy.ndarray，进行某种处理
 def check_input(func):
     def wrapper(self, x):
         if not isinstance(x, np.ndarray):  # 适用SplitDict
-            x = x.copy()
+            x = x.copy()  # 写时复制，不复制数据；随后替换full_data，也不会写入原对象
             x.full_data = func(self, x.full_data)
             return x
         else:
@@ -12,35 +13,59 @@ def check_input(func):
     return wrapper
 
 
+def default_value_dtype(data_type):
+    # 未指定VALUE_DTYPE时：DATA_TYPE为浮点（如float）则沿用，以免原按float64运算的滤波器悄然降为float32；否则为float32
+    data_type = np.dtype(data_type)
+    return data_type if data_type.kind == 'f' else np.dtype(np.float32)
+
+
 class Filter:
 
+    STATELESS = False  # 为True时，filter只做逐点运算或沿最后两维的运算，多帧堆叠后可直接整体处理
+
     def __init__(self, sensor_class, *args, **kwargs):
         if isinstance(sensor_class, dict):
             self.SENSOR_SHAPE = sensor_class['SENSOR_SHAPE']
             self.DATA_TYPE = sensor_class['DATA_TYPE']
+            self.VALUE_DTYPE = np.dtype(sensor_class.get('VALUE_DTYPE', default_value_dtype(self.DATA_TYPE)))
         else:
             self.SENSOR_SHAPE = sensor_class.SENSOR_SHAPE
             self.DATA_TYPE = sensor_class.DATA_TYPE
+            self.VALUE_DTYPE = np.dtype(getattr(sensor_class, 'VALUE_DTYPE', default_value_dtype(self.DATA_TYPE)))
         self.order = 0
 
     @property
     def sensor_class(self):
-        return {'SENSOR_SHAPE': self.SENSOR_SHAPE, 'DATA_TYPE': self.DATA_TYPE}
+        return {'SENSOR_SHAPE': self.SENSOR_SHAPE, 'DATA_TYPE': self.DATA_TYPE, 'VALUE_DTYPE': self.VALUE_DTYPE}
+
+    def as_value(self, x):
+        # 转为VALUE_DTYPE。产生浮点结果的滤波器先调用它，避免整型或float64的输入把结果提升为float64
+        return x if x.dtype == self.VALUE_DTYPE else x.astype(self.VALUE_DTYPE)
 
     @check_input
     def filter(self, x):
         return x
 
+    def filter_batch(self, x):
+        """
+        依次对多帧滤波，结果与逐帧调用filter相同
+        :param x: (帧数, *SENSOR_SHAPE)的np.ndarray
+        :return: (帧数, ...)的np.ndarray
+        """
+        if type(self).filter is Filter.filter:  # 未重写filter，即不做处理
+            return x
+        if self.STATELESS:
+            return self.filter(x)
+        return np.stack([self.filter(_) for _ in x])
+
     def reset(self):
         pass
 
     def __mul__(self, other):
         if isinstance(other, Filter):
-            return _CombinedFilter({'SENSOR_SHAPE': self.SENSOR_SHAPE, 'DATA_TYPE': self.DATA_TYPE},
-                                   self, other)
+            return _CombinedFilter(self.sensor_class, self, other)
         elif isinstance(float(other), float):
-            return _ResizedFilter({'SENSOR_SHAPE': self.SENSOR_SHAPE, 'DATA_TYPE': self.DATA_TYPE},
-                                  self, other)
+            return _ResizedFilter(self.sensor_class, self, other)
         else:
             raise TypeError("不支持的操作数类型")
 
@@ -54,6 +79,9 @@ class _CombinedFilter(Filter):
     def filter(self, x):
         return self.filter2.filter(self.filter1.filter(x))
 
+    def filter_batch(self, x):
+        return self.filter2.filter_batch(self.filter1.filter_batch(x))
+
 class _ResizedFilter(Filter):
     def __init__(self, sensor_class, this, rate, *args, **kwargs):
         super().__init__(sensor_class, *args, **kwargs)
@@ -62,7 +90,10 @@ class _ResizedFilter(Filter):
 
     @check_input
     def filter(self, x):
-        return self.rate * self.this.filter(x) + (1 - self.rate) * x
+        return self.rate * self.this.filter(x) + (1 - self.rate) * self.as_value(x)
+
+    def filter_batch(self, x):
+        return self.rate * self.this.filter_batch(x) + (1 - self.rate) * self.as_value(x)
 
 
 class RCFilter(Filter):
@@ -73,9 +104,21 @@ class RCFilter(Filter):
 
     @check_input
     def filter(self, x):
-        self.y = self.alpha * x + (1 - self.alpha) * self.y
+        self.y = self.alpha * self.as_value(x) + (1 - self.alpha) * self.y
         return self.y
 
+    def filter_batch(self, x):
+        # 一阶递推沿时间轴的scan：y[t] = alpha * x[t] + (1 - alpha) * y[t - 1]
+        # lfilter以输入的dtype运算，每步的运算与filter相同，结果一致。其余dtype的组合逐帧处理
+        x = self.as_value(x)
+        if x.dtype not in (np.float32, np.float64) or not (np.isscalar(self.y) or self.y.dtype == x.dtype):
+            return super().filter_batch(x)
+        initial = np.broadcast_to((1 - self.alpha) * np.asarray(self.y, dtype=x.dtype), x.shape[1:])[None]
+        y, _ = lfilter(np.array([self.alpha], dtype=x.dtype), np.array([1., -(1 - self.alpha)], dtype=x.dtype),
+                       x, axis=0, zi=initial)
+        self.y = y[-1].copy()
+        return y
+
 
 class RCFilterHP(Filter):
     def __init__(self, sensor_class, alpha=0.75, limit=None, *args, **kwargs):
@@ -87,6 +130,7 @@ class RCFilterHP(Filter):
 
     @check_input
     def filter(self, x):
+        x = self.as_value(x)
         y_low = self.alpha * x + (1 - self.alpha) * self.y_low
         self.y_low = (np.clip(y_low, self.y_low - self.limit, self.y_low + self.limit)) if self.limit is not None else y_low
         # 高通 = 原始信号 - 低通成分
@@ -120,6 +164,9 @@ class BandPassFilter:
         band_passed = self.high_filter.filter(high_passed)
         return band_passed
 
+    def filter_batch(self, x):
+        return self.high_filter.filter_batch(self.low_filter.filter_batch(x))
+
     def reset(self):
         """
         重置滤波器状态
@@ -127,20 +174,35 @@ class BandPassFilter:
         self.low_filter.reset()
         self.high_filter.reset()
 
+
+def sliding_windows(passed_values, x):
+    """
+    中值、最大值、均值滤波器的多帧处理：各帧对应的窗口
+    :param passed_values: 滤波器保存的最近各帧，最新的在前
+    :param x: (帧数, ...)的新帧
+    :return: ((窗口长度, 帧数, ...)的窗口，最新的在前，与passed_values的顺序相同; 处理完后的passed_values)
+    """
+    length = passed_values.shape[0]
+    count = x.shape[0]
+    history = np.concatenate([passed_values[::-1], x.astype(passed_values.dtype)])  # 按时间先后
+    windows = np.stack([history[length - k:length - k + count] for k in range(length)])
+    return windows, history[:-length - 1:-1].copy()
+
+
 class RCFilterOneSide(Filter):
     def __init__(self, sensor_class, alpha=0.75, *args, **kwargs):
         super(RCFilterOneSide, self).__init__(sensor_class)
         self.alpha = alpha
-        self.y = np.zeros(self.SENSOR_SHAPE, dtype=self.DATA_TYPE)
+        self.y = np.zeros(self.SENSOR_SHAPE, dtype=self.VALUE_DTYPE)
         self.last_x = np.zeros(self.SENSOR_SHAPE, dtype=self.DATA_TYPE)
 
     @check_input
     def filter(self, x):
-        y_up = (1 - self.alpha) * x + self.alpha * self.y
-        y_down = (1 + self.alpha) * x + (- self.alpha) * self.y
-        channels_down = np.where(x < self.last_x, 1., 0.)
+        value = self.as_value(x)
+        y_up = (1 - self.alpha) * value + self.alpha * self.y
+        y_down = (1 + self.alpha) * value + (- self.alpha) * self.y
+        self.y = np.where(x < self.last_x, y_down, y_up)
         self.last_x = x.copy()
-        self.y = y_down * channels_down + y_up * (1. - channels_down)
         return self.y
 
 
@@ -155,7 +217,11 @@ class MedianFilter(Filter):
     def filter(self, x):
         self.passed_values = np.roll(self.passed_values, 1, axis=0)
         self.passed_values[0, ...] = x
-        return np.median(self.passed_values, axis=0)
+        return self.as_value(np.median(self.passed_values, axis=0))
+
+    def filter_batch(self, x):
+        windows, self.passed_values = sliding_windows(self.passed_values, x)
+        return self.as_value(np.median(windows, axis=0))
 
 
 class MaximumFilter(Filter):
@@ -170,6 +236,10 @@ class MaximumFilter(Filter):
         self.passed_values[0, ...] = x
         return np.max(self.passed_values, axis=0)
 
+    def filter_batch(self, x):
+        windows, self.passed_values = sliding_windows(self.passed_values, x)
+        return np.max(windows, axis=0)
+
 
 class MeanFilter(Filter):
     def __init__(self, sensor_class, order):
@@ -181,11 +251,17 @@ class MeanFilter(Filter):
     def filter(self, x):
         self.passed_values = np.roll(self.passed_values, 1, axis=0)
         self.passed_values[0, ...] = x
-        return np.mean(self.passed_values, axis=0)
+        return np.mean(self.passed_values, axis=0, dtype=self.VALUE_DTYPE)
+
+    def filter_batch(self, x):
+        windows, self.passed_values = sliding_windows(self.passed_values, x)
+        return np.mean(windows, axis=0, dtype=self.VALUE_DTYPE)
 
 
 class CrosstalkFilter(Filter):
 
+    STATELESS = True
+
     def __init__(self, sensor_class, base_length, weight, iteration_count):
         super(CrosstalkFilter, self).__init__(sensor_class)
         self.base_length = base_length
@@ -194,21 +270,21 @@ class CrosstalkFilter(Filter):
         #
         xx = np.arange(sensor_class.SENSOR_SHAPE[0]).reshape((-1, 1))
         yy = np.arange(sensor_class.SENSOR_SHAPE[1]).reshape((1, -1))
-        self.length_modification = (xx + yy + self.base_length) / self.base_length if self.base_length is not None \
-            else np.ones(sensor_class.SENSOR_SHAPE)
+        self.length_modification = ((xx + yy + self.base_length) / self.base_length).astype(self.VALUE_DTYPE) \
+            if self.base_length is not None else np.ones(sensor_class.SENSOR_SHAPE, dtype=self.VALUE_DTYPE)
         #
         self.size = np.sqrt(self.SENSOR_SHAPE[0] * self.SENSOR_SHAPE[1])
 
     @check_input
     def filter(self, x):
-        x = np.maximum(x.astype(float), 1.)
+        x = np.maximum(self.as_value(x), 1.)
         x_original = x
         for _ in range(self.iteration_count):
             # mean = np.mean(x * self.size)
-            by_row = np.sum(x, axis=1, keepdims=True)
-            by_col = np.sum(x, axis=0, keepdims=True)
-            by_row_weighted = np.sum(x * by_col, axis=1, keepdims=True) / np.sum(by_col, axis=1, keepdims=True)
-            by_col_weighted = np.sum(x * by_row, axis=0, keepdims=True) / np.sum(by_row, axis=0, keepdims=True)
+            by_row = np.sum(x, axis=-1, keepdims=True)
+            by_col = np.sum(x, axis=-2, keepdims=True)
+            by_row_weighted = np.sum(x * by_col, axis=-1, keepdims=True) / np.sum(by_col, axis=-1, keepdims=True)
+            by_col_weighted = np.sum(x * by_row, axis=-2, keepdims=True) / np.sum(by_row, axis=-2, keepdims=True)
             # crossed = by_row_weighted ** -1 + by_col_weighted ** -1 + mean ** -1
             crossed = by_row_weighted ** -1 + by_col_weighted ** -1
             x = np.maximum(x - crossed ** -1 * self.weight, 1.)
@@ -217,6 +293,8 @@ class CrosstalkFilter(Filter):
 
 class ExtensionFilter(Filter):
 
+    STATELESS = True
+
     def __init__(self, sensor_class, weight_row, weight_col, iteration_count):
         super().__init__(sensor_class)
         self.weight_row = weight_row
@@ -227,28 +305,30 @@ class ExtensionFilter(Filter):
     @check_input
     def filter(self, x):
         x_original = x
-        x = np.maximum(x, 0)
+        x = np.maximum(self.as_value(x), 0)
         for _ in range(self.iteration_count):
-            by_row = np.sum(x, axis=1, keepdims=True) / self.SENSOR_SHAPE[1]
-            by_col = np.sum(x, axis=0, keepdims=True) / self.SENSOR_SHAPE[0]
+            by_row = np.sum(x, axis=-1, keepdims=True) / self.SENSOR_SHAPE[1]
+            by_col = np.sum(x, axis=-2, keepdims=True) / self.SENSOR_SHAPE[0]
             x = np.maximum(x - by_row * self.weight_row - by_col * self.weight_col, 0)
         return x
 
 
 class SideFilter(Filter):
     # 抑制边缘
+    STATELESS = True
+
     def __init__(self, sensor_class, width):
         super(SideFilter, self).__init__(sensor_class)
         self.width = width
 
     @check_input
     def filter(self, x):
-        x = x.copy()
+        x = x.astype(self.VALUE_DTYPE)  # 复制
         # 越靠近边缘，衰减越多
-        x[:self.width, :] *= np.linspace(0, 1, self.width)[:, None]
-        x[-self.width:, :] *= np.linspace(1, 0, self.width)[:, None]
-        x[:, :self.width] *= np.linspace(0, 1, self.width)[None, :]
-        x[:, -self.width:] *= np.linspace(1, 0, self.width)[None, :]
+        x[..., :self.width, :] *= np.linspace(0, 1, self.width)[:, None]
+        x[..., -self.width:, :] *= np.linspace(1, 0, self.width)[:, None]
+        x[..., :, :self.width] *= np.linspace(0, 1, self.width)[None, :]
+        x[..., :, -self.width:] *= np.linspace(1, 0, self.width)[None, :]
         return x
 
 class FactorFilter(Filter):
@@ -261,19 +341,19 @@ class FactorFilter(Filter):
 
 class OverallFocusFilter(Filter):
 
+    STATELESS = True
+
     def __init__(self, sensor_class, power):
         super(OverallFocusFilter, self).__init__(sensor_class)
         self.power = power
 
     @check_input
     def filter(self, x):
-        x = np.maximum(x, 0.)
-        original_sum = np.sum(x)
-        target_sum = np.sum(x ** self.power) ** (self.power ** -1)
-        if original_sum == 0:
-            return x
-        else:
-            return x * (target_sum / original_sum)
+        x = np.maximum(self.as_value(x), 0.)
+        original_sum = np.sum(x, axis=(-2, -1), keepdims=True)
+        target_sum = np.sum(x ** self.power, axis=(-2, -1), keepdims=True) ** (self.power ** -1)
+        # 总和为0的帧不缩放
+        return x * np.divide(target_sum, original_sum, out=np.ones_like(original_sum), where=original_sum != 0)
 
 
 def build_preset_filters(sensor_class):
@@ -312,3 +392,28 @@ if __name__ == '__main__':
     for v in arr:
         vv = f.filter(np.array([[v]]))
         print(v, vv, f.y)
+
+    # VALUE_DTYPE为float32时，与float64的结果之差应在单精度的舍入误差内
+    frames = np.random.default_rng(0).integers(0, 3000, (50, 64, 64)).astype('>i2')
+    for name, build in build_preset_filters({'SENSOR_SHAPE': (64, 64), 'DATA_TYPE': '>i2'}).items():
+        results = {}
+        for dtype in [np.float32, np.float64]:
+            sensor_class = type('SensorClass', (), {'SENSOR_SHAPE': (64, 64), 'DATA_TYPE': '>i2', 'VALUE_DTYPE': dtype})
+            f = (build_preset_filters(sensor_class)[name]() * RCFilter(sensor_class, 0.25)) * 0.5
+            results[dtype] = np.stack([f.filter(x) for x in frames])
+        assert results[np.float32].dtype == np.float32 and results[np.float64].dtype == np.float64, name
+        error = np.abs(results[np.float32] - results[np.float64]).max() / np.abs(results[np.float64]).max()
+        assert error < 1e-6, (name, error)
+    # alpha很小的RCFilterHP是缓慢的积分器，y_low每步的舍入误差衰减很慢，累积约为单精度eps / sqrt(alpha)
+    frames = np.random.default_rng(1).integers(0, 3000, (3000, 64, 64)).astype('>i2')
+    results = {}
+    for dtype in [np.float32, np.float64]:
+        f = RCFilterHP({'SENSOR_SHAPE': (64, 64), 'DATA_TYPE': '>i2', 'VALUE_DTYPE': dtype}, alpha=0.001)
+        results[dtype] = np.stack([f.filter(x) for x in frames])
+        assert results[dtype].dtype == dtype and f.y_low.dtype == dtype
+    error = np.abs(results[np.float32] - results[np.float64]).max() / np.abs(results[np.float64]).max()
+    assert error < 1e-4, ('RCFilterHP', error)
+    # 未指定VALUE_DTYPE时，浮点的DATA_TYPE沿用（如float即float64），整型为float32
+    assert Filter({'SENSOR_SHAPE': (64, 64), 'DATA_TYPE': float}).VALUE_DTYPE == np.float64
+    assert Filter({'SENSOR_SHAPE': (64, 64), 'DATA_TYPE': '>i2'}).VALUE_DTYPE == np.float32
+    print('float32与float64的结果一致')
@@ -7,17 +7,21 @@ import time
 
 class Interpolation:
 
-    def __init__(self, interp, blur, sensor_shape, use_median=False):
+    def __init__(self, interp, blur, sensor_shape, use_median=False, dtype=np.float32):
+        """
+        :param dtype: 运算及输出的dtype。scipy.ndimage的滤波与缩放按输入的dtype运算
+        """
         self.interp = interp
         self.blur = blur
         self.use_median = use_median
+        self.dtype = np.dtype(dtype)
         if blur > 16:
             raise Exception("过大的模糊参数")
         self.sensor_shape = sensor_shape
 
     def smooth(self, data):
         if isinstance(data, np.ndarray):
-            data = data.astype(float)
+            data = data.astype(self.dtype, copy=False)
             if self.use_median:
                 data = median_filter(data, size=3, mode='constant', cval=0)
             if self.blur > 0:
@@ -30,6 +34,21 @@ class Interpolation:
                 data[k] = self.smooth(data[k])
             return data
 
+    def smooth_batch(self, data):
+        """
+        处理多帧，结果与逐帧调用smooth相同。时间轴上不做滤波
+        :param data: (帧数, H, W)的np.ndarray
+        """
+        data = data.astype(self.dtype, copy=False)
+        if self.use_median:
+            data = median_filter(data, size=(1, 3, 3), mode='constant', cval=0)
+        if self.blur > 0:
+            data = gaussian_filter(data, sigma=(0, self.blur, self.blur), mode='constant', cval=0)
+        if self.interp == 1:
+            return zoom(data, 1, order=1)
+        # 三维的线性插值要多算一倍的角点，逐帧缩放反而更快
+        return np.stack([self.zoom(_) for _ in data])
+
     def zoom(self, data):
         zoom_factors = self.interp
         zoomed_data = zoom(data, zoom_factors, order=1)
@@ -39,3 +58,10 @@ class Interpolation:
 if __name__ == '__main__':
     a = np.array([[1, 2, 3, 4, 5], [6, 7, 8, 9, 10], [11, 12, 13, 14, 15]])
     print(median_filter(a, size=3, mode='constant', cval=0))
+    # float32与float64的结果之差应在单精度的舍入误差内
+    data = np.random.default_rng(0).random((64, 64)) * 3000
+    for interp, blur, use_median in [(1, 0., False), (2, 0.5, True), (4, 2., False)]:
+        result_32 = Interpolation(interp, blur, data.shape, use_median, np.float32).smooth(data)
+        result_64 = Interpolation(interp, blur, data.shape, use_median, np.float64).smooth(data)
+        assert result_32.dtype == np.float32
+        assert np.abs(result_32 - result_64).max() / np.abs(result_64).max() < 1e-6
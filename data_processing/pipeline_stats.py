@@ -0,0 +1,187 @@
+# DataHandler处理流程的计时统计：各环节的耗时，及采集时刻到处理完成、到界面绘制的端到端延迟
+# 默认关闭，可随时开关（DataHandler.pipeline_stats.enabled = True，或config中"pipeline_stats": true）
+# 关闭时每个计时点只有一次方法调用的开销。读取用snapshot()，导出用dump(path)
+
+import json
+import time
+
+import numpy as np
+
+STAGES = (
+    'get_data',  # 从驱动取数据
+    'filter_frame',  # 空间滤波
+    'filter_time',  # 时间滤波
+    'filters_for_each',  # 分片各自的滤波
+    'calibration',  # calibration_adaptor.transform_frame
+    'ai_calibration',
+    'interpolation',  # interpolation.smooth
+    'filter_after_zero',  # 减零点及其后的滤波
+    'features',  # 总值、峰值、追踪点
+    'append',  # 写入历史记录
+    'write_to_file',
+)
+LATENCIES = (
+    'capture_to_processed',  # 采集时刻到写入历史记录
+    'capture_to_display',  # 采集时刻到界面绘制
+)
+WINDOW = 1000  # 计算分位数所用的最近样本数
+# 延迟直方图的分箱边界(ms)，对数间隔。首尾两箱收纳超出范围的样本
+HISTOGRAM_EDGES_MS = np.concatenate([[0.], np.logspace(-1, 4, 26)])
+
+
+class RollingSeries:
+    # 一项耗时的累计计数，及最近WINDOW个样本（用于分位数）
+    # 单写者；读者在另一线程读取时，至多差最新的一个样本
+
+    def __init__(self, window=WINDOW):
+        self.samples = [0] * window
+        self.sample_count = 0  # 写入的样本数。批处理的一批只写一个样本
+        self.count = 0
+        self.total_ns = 0
+
+    def add(self, elapsed_ns, n=1):
+        """
+        :param elapsed_ns: 每次的耗时(ns)
+        :param n: 次数。批处理时，一批的耗时平均到每帧
+        """
+        self.samples[self.sample_count % self.samples.__len__()] = elapsed_ns
+        self.sample_count += 1
+        self.count += n
+        self.total_ns += elapsed_ns * n
+
+    def summary(self) -> dict:
+        count = self.count
+        samples = np.array(self.samples[:min(self.sample_count, self.samples.__len__())], dtype=float) * 1e-3
+        if samples.__len__():
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        else:
+            p50 = p95 = p99 = 0.
+        return {
+            'count': count,
+            'mean_us': self.total_ns * 1e-3 / count if count else 0.,
+            'p50_us': float(p50),
+            'p95_us': float(p95),
+            'p99_us': float(p99),
+            'total_ms': self.total_ns * 1e-6,
+        }
+
+
+class LatencyHistogram(RollingSeries):
+    # 在分位数之外，按HISTOGRAM_EDGES_MS累计全部样本的直方图
+
+    def __init__(self, window=WINDOW):
+        super().__init__(window)
+        self.histogram = np.zeros((HISTOGRAM_EDGES_MS.__len__(), ), dtype=np.int64)
+
+    def add(self, elapsed_ns, n=1):
+        super().add(elapsed_ns, n)
+        self.histogram[np.searchsorted(HISTOGRAM_EDGES_MS, elapsed_ns * 1e-6, side='right') - 1] += n
+
+    def summary(self) -> dict:
+        ret = super().summary()
+        ret['histogram'] = {'edges_ms': HISTOGRAM_EDGES_MS.tolist(), 'counts': self.histogram.tolist()}
+        return ret
+
+
+class PipelineStats:
+    # 用法：
+    # t = stats.tic()
+    # ...  # 某一环节
+    # t = stats.toc('filter_frame', t)  # 返回当前时刻，可接着计下一环节
+    # 关闭时tic返回None，toc直接返回None，不取时间
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {name: RollingSeries() for name in STAGES}
+        self.latencies = {name: LatencyHistogram() for name in LATENCIES}
+        self.last_displayed = None  # 上次绘制的快照版本，同一快照重复绘制时不重复计入
+
+    def tic(self):
+        return time.perf_counter_ns() if self.enabled else None
+
+    def toc(self, stage, t, n=1):
+        """
+        :param t: tic或上一次toc的返回值
+        :param n: 本次处理的帧数
+        :return: 当前时刻(ns)。关闭时为None
+        """
+        if t is None:
+            return None
+        time_now = time.perf_counter_ns()
+        self.stages[stage].add((time_now - t) // n, n)
+        return time_now
+
+    def latency(self, name, capture_ns, n=1):
+        """
+        计入一次端到端延迟
+        :param capture_ns: 采集时刻的time.perf_counter_ns()。小于0（重放等）时不计
+        """
+        if self.enabled and capture_ns >= 0:
+            self.latencies[name].add(time.perf_counter_ns() - capture_ns, n)
+
+    def displayed(self, snapshot):
+        """
+        界面绘制了一个DataHandler.snapshot()后调用
+        """
+        if snapshot.version != self.last_displayed:
+            self.last_displayed = snapshot.version
+            self.latency('capture_to_display', snapshot.capture_ns)
+
+    def reset(self):
+        self.__init__(self.enabled)
+
+    def snapshot(self) -> dict:
+        """
+        :return: {'enabled': bool, 'stages': {环节: 统计}, 'latencies': {名称: 统计及直方图}}
+                 统计包括count、mean_us、p50_us、p95_us、p99_us、total_ms
+        """
+        return {
+            'enabled': self.enabled,
+            'stages': {name: series.summary() for name, series in self.stages.items()},
+            'latencies': {name: series.summary() for name, series in self.latencies.items()},
+        }
+
+    def dump(self, path):
+        report = dict(self.snapshot(), time=time.strftime('%Y-%m-%d %H:%M:%S'))
+        with open(path, 'wt') as f:
+            json.dump(report, f, indent=2)
+
+    def __str__(self):
+        snapshot = self.snapshot()
+        lines = [f'{name}: n={value["count"]}, p50 {value["p50_us"]:.1f}us, p95 {value["p95_us"]:.1f}us, '
+                 f'p99 {value["p99_us"]:.1f}us'
+                 for group in (snapshot['stages'], snapshot['latencies'])
+                 for name, value in group.items() if value['count']]
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    # 开销，及分位数与直方图的正确性
+    stats = PipelineStats()
+    t = stats.tic()
+    time_begin = time.perf_counter()
+    for _ in range(100000):
+        t = stats.toc('filter_frame', t)
+    print(f'关闭时每个计时点{(time.perf_counter() - time_begin) / 100000 * 1e9:.0f}ns')
+    stats.enabled = True
+    t = stats.tic()
+    time_begin = time.perf_counter()
+    for _ in range(100000):
+        t = stats.toc('filter_frame', t)
+    print(f'开启时每个计时点{(time.perf_counter() - time_begin) / 100000 * 1e9:.0f}ns')
+
+    stats.reset()
+    for idx in range(3000):
+        stats.stages['calibration'].add((idx % 100 + 1) * 1000)
+    summary = stats.snapshot()['stages']['calibration']
+    assert summary['count'] == 3000 and abs(summary['p50_us'] - 50.5) < 1 and summary['p99_us'] > 98
+    stats.toc('interpolation', time.perf_counter_ns() - 8000, n=4)
+    summary = stats.snapshot()['stages']['interpolation']
+    assert summary['count'] == 4 and summary['p50_us'] >= 2
+    for latency_ms in [0.05, 0.5, 5., 50., 1e5]:
+        stats.latency('capture_to_processed', time.perf_counter_ns() - int(latency_ms * 1e6))
+    stats.latency('capture_to_processed', -1)
+    counts = stats.snapshot()['latencies']['capture_to_processed']['histogram']['counts']
+    assert sum(counts) == 5 and counts[0] == 1 and counts[-1] == 1
+    json.dumps(stats.snapshot())
+    print(stats)
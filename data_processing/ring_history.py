@@ -0,0 +1,206 @@
+import numpy as np
+
+
+class RingHistory:
+    # 定长的历史记录，接口与deque(maxlen=...)的常用部分相同：append、[-1]、len、clear、迭代
+    # 数据存放在预分配的连续数组中，每个元素写两份（位置i和i + maxlen），任意时刻按时间顺序的全部元素都是一段连续的切片
+    # 因此append为O(1)，view()和np.asarray(history)不复制数据
+    # 首次append时按元素的形状和dtype分配；元素不是数值或数组（如list），或形状改变时，改用object数组
+    # 定义了__array__的元素（如SplitDataDict）按其数组存入数值数组，另以同样布局的object数组保留元素本身：
+    # 下标、迭代取得的是元素本身，view()与np.asarray(history)仍是堆叠好的数值数组
+
+    def __init__(self, maxlen):
+        assert maxlen > 0
+        self.maxlen = maxlen
+        self.storage = None  # (2 * maxlen, ...)
+        self.wrappers = None  # (2 * maxlen, )的object数组，存放定义了__array__的元素本身。没有这类元素时为None
+        self.total = 0  # 写入的元素总数
+        self.count = 0  # 当前元素数
+
+    @staticmethod
+    def __is_numeric(item):
+        return isinstance(item, (np.ndarray, np.generic, int, float, bool))
+
+    @classmethod
+    def __as_numeric(cls, item):
+        # 可存入数值数组的形式。不能存入时为None
+        if cls.__is_numeric(item):
+            return item
+        if hasattr(item, '__array__'):
+            array = np.asarray(item)
+            if array.dtype != object:
+                return array
+        return None
+
+    def __allocate(self, item):
+        if self.__is_numeric(item):
+            item = np.asarray(item)
+            self.storage = np.zeros((2 * self.maxlen, ) + item.shape, dtype=item.dtype)
+        else:
+            self.storage = np.empty((2 * self.maxlen, ), dtype=object)
+
+    def __prepare(self, item, numeric):
+        # 需要时重新分配，使storage能够存放item。numeric为item可存入数值数组的形式，不能时为None
+        if self.storage is not None and self.storage.dtype != object:
+            fits = numeric is not None and np.shape(numeric) == self.storage.shape[1:]
+            if not fits and self.count == 0:
+                self.storage = None
+                self.wrappers = None
+            elif not fits:
+                storage = np.empty((2 * self.maxlen, ), dtype=object)
+                for idx in range(storage.__len__()):
+                    storage[idx] = self.storage[idx] if self.wrappers is None else self.wrappers[idx]
+                self.storage = storage
+                self.wrappers = None
+            elif not np.can_cast(np.asarray(numeric).dtype, self.storage.dtype):
+                self.storage = self.storage.astype(np.result_type(self.storage.dtype, np.asarray(numeric).dtype))
+        if self.storage is None:
+            self.__allocate(item if numeric is None else numeric)
+        if self.storage.dtype != object and self.wrappers is None and numeric is not item:
+            # 首个定义了__array__的元素。此前的元素就是其数组本身
+            self.wrappers = np.empty((2 * self.maxlen, ), dtype=object)
+            for idx in range(self.wrappers.__len__()):
+                self.wrappers[idx] = self.storage[idx]
+
+    def __write(self, position, item):
+        numeric = None if self.storage is not None and self.storage.dtype == object else self.__as_numeric(item)
+        self.__prepare(item, numeric)
+        if self.storage.dtype == object:
+            self.storage[position] = item
+            self.storage[position + self.maxlen] = item
+        else:
+            self.storage[position] = numeric
+            self.storage[position + self.maxlen] = self.storage[position]
+            if self.wrappers is not None:
+                self.wrappers[position] = item
+                self.wrappers[position + self.maxlen] = item
+
+    def append(self, item):
+        self.__write(self.total % self.maxlen, item)
+        self.total += 1
+        self.count = min(self.count + 1, self.maxlen)
+
+    def clear(self):
+        # 数值数组留待复用；object数组释放，不再引用其中的元素
+        self.count = 0
+        self.total = 0
+        self.wrappers = None
+        if self.storage is not None and self.storage.dtype == object:
+            self.storage = None
+
+    def view(self):
+        """
+        按时间先后的全部元素
+        :return: (len, ...)的数组视图，为只读。之后的append可能改写其内容，需保留时复制
+        """
+        if self.storage is None:
+            return np.zeros((0, ))
+        begin = (self.total - self.count) % self.maxlen
+        view = self.storage[begin:begin + self.count]
+        view.flags.writeable = False
+        return view
+
+    def __items(self):
+        # 按时间先后的全部元素本身
+        if self.wrappers is None:
+            return self.view()
+        begin = (self.total - self.count) % self.maxlen
+        return self.wrappers[begin:begin + self.count]
+
+    def __array__(self, dtype=None, copy=None):
+        view = self.view()
+        if copy:
+            view = view.copy()
+        return view if dtype is None else view.astype(dtype, copy=False)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.__items())
+
+    def __getitem__(self, idx):
+        return self.__items()[idx]
+
+    def __setitem__(self, idx, item):
+        # 只支持单个元素，如history[-1] = x
+        if not -self.count <= idx < self.count:
+            raise IndexError('RingHistory index out of range')
+        self.__write((self.total - self.count + idx % self.count) % self.maxlen, item)
+
+    def __repr__(self):
+        return f'RingHistory({self.view()!r}, maxlen={self.maxlen})'
+
+
+if __name__ == '__main__':
+    # 与deque的行为对比，并测append的开销
+    import time
+    from collections import deque
+
+    rng = np.random.default_rng(0)
+    for maxlen in [1, 3, 64]:
+        history = RingHistory(maxlen)
+        reference = deque(maxlen=maxlen)
+        for step in range(200):
+            frame = rng.random((4, 5))
+            history.append(frame)
+            reference.append(frame)
+            if step % 37 == 5:
+                frame = rng.random((4, 5))
+                history[-1] = frame
+                reference[-1] = frame
+            if step % 71 == 70:
+                history.clear()
+                reference.clear()
+            assert history.__len__() == reference.__len__()
+            assert np.array_equal(np.asarray(history), np.array(reference).reshape((-1, 4, 5)))
+            if reference:
+                assert np.array_equal(history[-1], reference[-1]) and np.array_equal(history[0], reference[0])
+    # 标量、改变形状、非数值的元素
+    history = RingHistory(4)
+    for v in [1, 2, 3.5, 4, 5]:
+        history.append(v)
+    assert history.storage.dtype == float and list(history) == [2, 3.5, 4, 5]
+    history.append(np.zeros(3))
+    assert history.storage.dtype == object and history.__len__() == 4 and history[0] == 3.5
+    history.append([1, 2])
+    assert history[-1] == [1, 2]
+    # 分片传感器的SplitDataDict：下标取得元素本身，np.asarray为堆叠的数值数组，可按DataHandler.set_zero的方式求零点
+    from backends.tactile_split import SplitDataDict
+    range_mapping = {0: [(slice(0, 4), slice(0, 5)), False, False, False, 1., 1.],
+                     1: [(slice(4, 8), slice(0, 5)), True, False, True, 2., 1.5]}
+    history = RingHistory(3)
+    frames = [rng.random((8, 5)) - 0.2 for _ in range(5)]
+    for frame in frames:
+        history.append(SplitDataDict(frame, range_mapping))
+    assert isinstance(history[-1], SplitDataDict) and np.array_equal(history[-1][1], SplitDataDict(frames[-1], range_mapping)[1])
+    assert history.storage.dtype == float and np.array_equal(np.asarray(history), np.stack(frames[-3:]))
+    zero = np.mean(np.maximum(np.asarray(history)[-2:, ...], 0), axis=0)
+    assert np.array_equal(zero, np.mean(np.maximum(np.stack(frames[-2:]), 0), axis=0))
+    assert isinstance(history[-1] - zero, SplitDataDict)
+    history[-1] = frames[0]
+    assert np.array_equal(history[-1], frames[0]) and np.array_equal(np.asarray(history)[-1], frames[0])
+    history.clear()
+    history.append(frames[1])
+    assert history.wrappers is None and np.array_equal(history[-1], frames[1])
+
+    for shape in [(), (64, 64), (128, 128)]:
+        frame = np.zeros(shape)
+        history = RingHistory(256)
+        reference = deque(maxlen=256)
+        time_begin = time.perf_counter()
+        for _ in range(10000):
+            history.append(frame)
+        time_history = time.perf_counter() - time_begin
+        time_begin = time.perf_counter()
+        for _ in range(100):
+            np.asarray(history)
+        time_view = time.perf_counter() - time_begin
+        for _ in range(256):
+            reference.append(frame)
+        time_begin = time.perf_counter()
+        for _ in range(100):
+            np.asarray(reference)
+        time_deque = time.perf_counter() - time_begin
+        print(f'{shape}: append {time_history / 10000 * 1e6:.2f}us, '
+              f'np.asarray {time_view / 100 * 1e6:.2f}us (deque {time_deque / 100 * 1e6:.2f}us)')
@@ -109,15 +109,19 @@ class OrdinaryPlot:
             self.__apply_y_lim()
 
     def trigger(self):
-        with self.data_handler.lock:
-            if self.data_handler.value:
-                self.plot.setImage(apply_swap(self.scaling(np.array(self.data_handler.value[-1].T))),
-                                   levels=self.__y_lim)
-                if self.data_handler.using_calibration:
-                    self.lines_maximum[0].setData(self.data_handler.time, self.scaling(self.data_handler.summed))
-                else:
-                    self.lines_maximum[0].setData(self.data_handler.time, self.scaling(self.data_handler.maximum))
-                if self.lines_tracing.__len__() == self.data_handler.tracing_points.__len__():
-                    for idx_line, line in enumerate(self.lines_tracing):
-                        line.setData(self.data_handler.t_tracing,
-                                     self.scaling([_[idx_line] for _ in self.data_handler.tracings]))
\ No newline at end of file
+        # 从快照绘制，不持有data_handler.lock，后台处理线程不会被绘制阻塞
+        # 只复制绘制用到的历史记录
+        curve = 'summed' if self.data_handler.using_calibration else 'maximum'
+        fields = ('value', 'time', curve, 'tracings') if self.lines_tracing else ('value', 'time', curve)
+        snapshot = self.data_handler.snapshot(fields)
+        if snapshot.value is not None:
+            self.plot.setImage(apply_swap(self.scaling(np.array(snapshot.value.T))),
+                               levels=self.__y_lim)
+            if curve == 'summed':
+                self.lines_maximum[0].setData(snapshot.time, self.scaling(snapshot.summed))
+            else:
+                self.lines_maximum[0].setData(snapshot.time, self.scaling(snapshot.maximum))
+            if self.lines_tracing.__len__() == snapshot.tracing_points.__len__():
+                for idx_line, line in enumerate(self.lines_tracing):
+                    line.setData(snapshot.t_tracing, self.scaling(snapshot.tracings[:, idx_line]))
+            self.data_handler.pipeline_stats.displayed(snapshot)